@@ -0,0 +1,238 @@
+from collections import defaultdict
+
+from sqlalchemy import text
+
+# Materialised dashboard counters. Every write adds its delta to four rows in stats_daily:
+# (farmer, day), (farmer, all time), (everyone, day) and (everyone, all time), in the same
+# transaction as the write, so dashboard reads are a primary-key lookup however large the
+# tables grow. Days are UTC day starts in epoch seconds.
+
+GLOBAL = '*'
+ALL_TIME = -1
+DAY = 86400
+
+METRICS = ('products', 'yield_total', 'transactions', 'revenue', 'active_shipments')
+
+# Stage statuses that mean the lot is still moving; 'completed' stages are not shipments
+ACTIVE_STAGE_STATUSES = frozenset({'pending', 'in_progress', 'in_transit'})
+
+
+def day_of(ts):
+    return (int(ts) // DAY) * DAY
+
+
+def revenue_of(price, quantity):
+    return (price or 0) * (quantity or 0)
+
+
+class StatsDelta:
+    """Accumulates metric changes for one transaction before they are upserted."""
+
+    def __init__(self):
+        self.cells = defaultdict(lambda: dict.fromkeys(METRICS, 0))
+
+    def add(self, farmer_id, ts, **metrics):
+        scopes = (GLOBAL, farmer_id) if farmer_id else (GLOBAL,)
+        days = (ALL_TIME, day_of(ts)) if ts is not None else (ALL_TIME,)
+        for scope in scopes:
+            for day in days:
+                cell = self.cells[(scope, day)]
+                for name, value in metrics.items():
+                    cell[name] += value
+
+    def __bool__(self):
+        return any(any(cell.values()) for cell in self.cells.values())
+
+    def apply(self, conn, table):
+        rows = [dict(cell, farmer_id=scope, day=day) for (scope, day), cell in self.cells.items()
+                if any(cell.values())]
+        upsert_add(conn, table, ['farmer_id', 'day'], METRICS, rows)
+        self.cells.clear()
+
+
+def upsert_add(conn, table, keys, metrics, rows):
+    """Insert rows, or add their metric values to the rows already stored under the same keys."""
+    if not rows:
+        return
+    if conn.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={name: table.c[name] + stmt.excluded[name] for name in metrics}
+    )
+    conn.execute(stmt, rows)
+
+
+def read(conn, table, farmer_id=GLOBAL, since=None):
+    """All-time totals for a scope, plus per-day rows from `since` (a timestamp) if given."""
+    totals = conn.execute(
+        table.select().where(table.c.farmer_id == farmer_id, table.c.day == ALL_TIME)
+    ).mappings().first()
+    totals = {name: (totals[name] if totals else 0) for name in METRICS}
+    if since is None:
+        return totals, []
+    days = conn.execute(
+        table.select().where(table.c.farmer_id == farmer_id, table.c.day >= day_of(since))
+        .order_by(table.c.day)
+    ).mappings().all()
+    return totals, [dict(row) for row in days]
+
+
+REBUILD_SQL = [
+    'DELETE FROM stats_daily',
+    # Products: count and yield by owner and creation day
+    """INSERT INTO stats_daily (farmer_id, day, products, yield_total, transactions, revenue, active_shipments)
+       SELECT created_by, (created_at / 86400) * 86400, count(*), coalesce(sum(quantity), 0), 0, 0, 0
+       FROM products GROUP BY created_by, (created_at / 86400) * 86400""",
+    # Transactions: count everything, revenue only for transactions that did not fail
+    """INSERT INTO stats_daily (farmer_id, day, products, yield_total, transactions, revenue, active_shipments)
+       SELECT from_user_id, (created_at / 86400) * 86400, 0, 0, count(*),
+              coalesce(sum(CASE WHEN status = 'failed' THEN 0 ELSE coalesce(price, 0) * coalesce(quantity, 0) END), 0), 0
+       FROM transactions WHERE from_user_id IS NOT NULL GROUP BY from_user_id, (created_at / 86400) * 86400
+       ON CONFLICT (farmer_id, day) DO UPDATE SET
+           transactions = stats_daily.transactions + excluded.transactions,
+           revenue = stats_daily.revenue + excluded.revenue""",
+    # Open stages, attributed to the farmer who owns the product
+    """INSERT INTO stats_daily (farmer_id, day, products, yield_total, transactions, revenue, active_shipments)
+       SELECT p.created_by, (s.timestamp / 86400) * 86400, 0, 0, 0, 0, count(*)
+       FROM supply_chain_stages s JOIN products p ON p.id = s.product_id
+       WHERE s.status IN ('pending', 'in_progress', 'in_transit')
+       GROUP BY p.created_by, (s.timestamp / 86400) * 86400
+       ON CONFLICT (farmer_id, day) DO UPDATE SET
+           active_shipments = stats_daily.active_shipments + excluded.active_shipments""",
+    # Roll the per-farmer days up into the all-time and everyone scopes
+    f"""INSERT INTO stats_daily (farmer_id, day, products, yield_total, transactions, revenue, active_shipments)
+       SELECT '{GLOBAL}', day, sum(products), sum(yield_total), sum(transactions), sum(revenue), sum(active_shipments)
+       FROM stats_daily GROUP BY day""",
+    f"""INSERT INTO stats_daily (farmer_id, day, products, yield_total, transactions, revenue, active_shipments)
+       SELECT farmer_id, {ALL_TIME}, sum(products), sum(yield_total), sum(transactions), sum(revenue), sum(active_shipments)
+       FROM stats_daily GROUP BY farmer_id""",
+]
+
+
+def rebuild(conn):
+    """Recompute stats_daily from the base tables (migration step and `flask stats-rebuild`)."""
+    for statement in REBUILD_SQL:
+        conn.execute(text(statement))
+
+
+# Time-series rollups: event counts and sums per (event, bucket, product type), at hour
+# and day resolution. Writes add to them like the counters above; history is filled by
+# backfill_rollups, which recomputes whole time windows with one GROUP BY per source.
+
+ROLLUP_INTERVALS = {'hour': 3600, 'day': DAY}
+ROLLUP_METRICS = ('count', 'quantity', 'amount')
+EVENTS = ('product_created', 'transaction', 'stage')
+
+
+class RollupDelta:
+    def __init__(self):
+        self.cells = defaultdict(lambda: dict.fromkeys(ROLLUP_METRICS, 0))
+
+    def add(self, event, product_type, ts, count=1, quantity=0, amount=0):
+        if ts is None:
+            return
+        for interval, width in ROLLUP_INTERVALS.items():
+            cell = self.cells[(interval, event, (int(ts) // width) * width, product_type or '')]
+            cell['count'] += count
+            cell['quantity'] += quantity or 0
+            cell['amount'] += amount or 0
+
+    def __bool__(self):
+        return bool(self.cells)
+
+    def apply(self, conn, tables):
+        """`tables` maps 'hour' and 'day' to the rollup tables."""
+        for interval, table in tables.items():
+            rows = [dict(cell, event=event, bucket=bucket, product_type=product_type)
+                    for (i, event, bucket, product_type), cell in self.cells.items() if i == interval]
+            upsert_add(conn, table, ['event', 'bucket', 'product_type'], ROLLUP_METRICS, rows)
+        self.cells.clear()
+
+
+# One statement per source; {w} is the bucket width in seconds, the window is [:start, :end)
+ROLLUP_SOURCES = [
+    """SELECT 'product_created', (created_at / {w}) * {w}, coalesce(product_type, ''),
+              count(*), coalesce(sum(quantity), 0), 0
+       FROM products WHERE created_at >= :start AND created_at < :end
+       GROUP BY (created_at / {w}) * {w}, coalesce(product_type, '')""",
+    """SELECT 'transaction', (t.created_at / {w}) * {w}, coalesce(p.product_type, ''),
+              count(*), coalesce(sum(t.quantity), 0), coalesce(sum(coalesce(t.price, 0) * coalesce(t.quantity, 0)), 0)
+       FROM transactions t LEFT JOIN products p ON p.id = t.product_id
+       WHERE t.created_at >= :start AND t.created_at < :end
+       GROUP BY (t.created_at / {w}) * {w}, coalesce(p.product_type, '')""",
+    """SELECT 'stage', (s.timestamp / {w}) * {w}, coalesce(p.product_type, ''), count(*), 0, 0
+       FROM supply_chain_stages s LEFT JOIN products p ON p.id = s.product_id
+       WHERE s.timestamp >= :start AND s.timestamp < :end
+       GROUP BY (s.timestamp / {w}) * {w}, coalesce(p.product_type, '')""",
+]
+
+ROLLUP_TABLES = {'hour': 'rollup_hourly', 'day': 'rollup_daily'}
+
+
+def history_range(conn):
+    row = conn.execute(text(
+        "SELECT min(lo), max(hi) FROM ("
+        " SELECT min(created_at) AS lo, max(created_at) AS hi FROM products"
+        " UNION ALL SELECT min(created_at), max(created_at) FROM transactions"
+        " UNION ALL SELECT min(timestamp), max(timestamp) FROM supply_chain_stages) AS r"
+    )).first()
+    return (row[0], row[1]) if row and row[0] is not None else (None, None)
+
+
+def backfill_window(conn, start, end):
+    """Recompute every rollup bucket in [start, end); both ends must be day-aligned."""
+    for interval, table in ROLLUP_TABLES.items():
+        conn.execute(text(f'DELETE FROM {table} WHERE bucket >= :start AND bucket < :end'),
+                     {'start': start, 'end': end})
+        for source in ROLLUP_SOURCES:
+            conn.execute(text(
+                f'INSERT INTO {table} (event, bucket, product_type, count, quantity, amount) '
+                + source.format(w=ROLLUP_INTERVALS[interval])
+            ), {'start': start, 'end': end})
+
+
+def rollup_windows(conn, chunk_days):
+    lo, hi = history_range(conn)
+    if lo is None:
+        return []
+    step = chunk_days * DAY
+    return [(start, start + step) for start in range(day_of(lo), hi + 1, step)]
+
+
+def backfill_rollups(engine, chunk_days=30, progress=None):
+    """Rebuild the rollups from history, one transaction per `chunk_days` window.
+
+    Each window is deleted and recomputed as a whole, so the job can be stopped and re-run,
+    and live writes landing in a window are never double counted. Returns the window count.
+    """
+    with engine.connect() as conn:
+        windows = rollup_windows(conn, chunk_days)
+    for start, end in windows:
+        with engine.begin() as conn:
+            backfill_window(conn, start, end)
+        if progress:
+            progress(start, end)
+    return len(windows)
+
+
+def backfill_rollups_in(conn, chunk_days=30):
+    """Migration step: the same backfill inside the caller's transaction."""
+    for start, end in rollup_windows(conn, chunk_days):
+        backfill_window(conn, start, end)
+
+
+def timeseries(conn, table, event, start, end, product_type=None):
+    """Rollup rows for one event in [start, end), grouped by product type."""
+    query = table.select().where(table.c.event == event, table.c.bucket >= start, table.c.bucket < end)
+    if product_type is not None:
+        query = query.where(table.c.product_type == product_type)
+    series = {}
+    for row in conn.execute(query.order_by(table.c.bucket)).mappings():
+        series.setdefault(row['product_type'], []).append(
+            {'t': row['bucket'], 'count': row['count'], 'quantity': row['quantity'], 'amount': row['amount']}
+        )
+    return series
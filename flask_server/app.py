@@ -1,15 +1,34 @@
 import os
-import io
+import click
+import csv
+import functools
 import base64
+import hashlib
 import json
 import time
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, send_file, redirect, url_for, render_template, send_from_directory
+from urllib.parse import urlencode
+from flask import Flask, Response, g, request, jsonify, send_file, redirect, url_for, render_template, send_from_directory
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from sqlalchemy import or_
-import qrcode
-from qrcode.image.svg import SvgImage
+from sqlalchemy import case, event, inspect, or_, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session as OrmSession, joinedload
+
+import analytics
+import auth
+import db_profile
+import events
+import ingest
+import migrations
+import search
+import serializers
+from labels import build_sheet, build_zip, render_many, render_qr_png, render_qr_svg
+from profiling import Profiler
+from qr_cache import QRRenderCache
+from response_cache import TaggedCache
+from serializers import iso_date, row_serializer
+from timeline import MemoryBackend, NullBackend, RedisBackend, TimelineCache
 
 # Initialize Flask with specific static/template configuration for SPA
 app = Flask(__name__, 
@@ -17,14 +36,31 @@ app = Flask(__name__,
             static_url_path='',  # Serve static files from root for /assets to work
             template_folder='templates')
 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///agrotrace.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = db_profile.database_url()
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = db_profile.engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.secret_key = 'dev-secret-key'
 
+# Who writes the chain. 'single': this process serves requests and mines (python app.py).
+# Under a multi-worker server only one process may extend the chain, so the web workers run
+# as 'reader' (read-only store, transactions left pending) and `flask chain-owner` mines.
+# Readers also skip per-process caches that only the writing process could invalidate.
+app.config.setdefault('CHAIN_ROLE', os.environ.get('CHAIN_ROLE', 'single'))
+app.config.setdefault('CHAIN_POLL_INTERVAL', float(os.environ.get('CHAIN_POLL_INTERVAL', 1.0)))
+
+CHAIN_ROLES = ('single', 'owner', 'reader')
+if app.config['CHAIN_ROLE'] not in CHAIN_ROLES:
+    raise ValueError(f"Unknown CHAIN_ROLE {app.config['CHAIN_ROLE']!r}; expected single, owner or reader")
+
 # Enable CORS
 CORS(app)
 
+# orjson-backed jsonify when available (JSON_PROVIDER=stdlib to opt out)
+serializers.install(app)
+
 db = SQLAlchemy(app)
+with app.app_context():
+    db_profile.install(db.engine)
 
 # ==========================================
 # MODELS
@@ -44,6 +80,14 @@ class User(db.Model):
     created_at = db.Column(db.Integer, default=lambda: int(time.time()))
     updated_at = db.Column(db.Integer, default=lambda: int(time.time()))
 
+    api_fields = {
+        'id': ('id', None), 'email': ('email', None), 'firstName': ('first_name', None),
+        'lastName': ('last_name', None), 'profileImageUrl': ('profile_image_url', None), 'role': ('role', None),
+        'companyName': ('company_name', None), 'location': ('location', None),
+        'verificationStatus': ('verification_status', None), 'createdAt': ('created_at', None),
+        'updatedAt': ('updated_at', None)
+    }
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -61,6 +105,12 @@ class User(db.Model):
 
 class Product(db.Model):
     __tablename__ = 'products'
+    __table_args__ = (
+        db.Index('ix_products_created_by_created_at_id', 'created_by', 'created_at', 'id'),
+        db.Index('ix_products_status_created_at_id', 'status', 'created_at', 'id'),
+        db.Index('ix_products_product_type_created_at_id', 'product_type', 'created_at', 'id'),
+        db.Index('ix_products_created_at_id', 'created_at', 'id'),
+    )
     id = db.Column(db.String, primary_key=True, default=lambda: os.urandom(8).hex().lower())
     name = db.Column(db.String, nullable=False)
     description = db.Column(db.String)
@@ -73,10 +123,25 @@ class Product(db.Model):
     expiry_date = db.Column(db.Integer)
     status = db.Column(db.String, nullable=False, default='created')
     qr_code = db.Column(db.String, unique=True)
-    created_by = db.Column(db.String, nullable=False)
+    created_by = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.Integer, default=lambda: int(time.time()))
     updated_at = db.Column(db.Integer, default=lambda: int(time.time()))
 
+    farmer = db.relationship('User', foreign_keys=[created_by])
+    stages = db.relationship('SupplyChainStage', back_populates='product')
+    verifications = db.relationship('Verification', back_populates='product')
+    transactions = db.relationship('Transaction', back_populates='product')
+
+    # API field name -> (column, formatter) for projected list queries
+    api_fields = {
+        'id': ('id', None), 'name': ('name', None), 'description': ('description', None),
+        'productType': ('product_type', None), 'batchNumber': ('batch_number', None),
+        'quantity': ('quantity', None), 'unit': ('unit', None), 'originFarmId': ('origin_farm_id', None),
+        'harvestDate': ('harvest_date', iso_date), 'expiryDate': ('expiry_date', iso_date),
+        'status': ('status', None), 'qrCode': ('qr_code', None), 'createdBy': ('created_by', None),
+        'createdAt': ('created_at', None), 'updatedAt': ('updated_at', None)
+    }
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -87,8 +152,8 @@ class Product(db.Model):
             'quantity': self.quantity,
             'unit': self.unit,
             'originFarmId': self.origin_farm_id,
-            'harvestDate': datetime.fromtimestamp(self.harvest_date).isoformat() if self.harvest_date else None,
-            'expiryDate': datetime.fromtimestamp(self.expiry_date).isoformat() if self.expiry_date else None,
+            'harvestDate': iso_date(self.harvest_date),
+            'expiryDate': iso_date(self.expiry_date),
             'status': self.status,
             'qrCode': self.qr_code,
             'createdBy': self.created_by,
@@ -98,17 +163,30 @@ class Product(db.Model):
 
 class SupplyChainStage(db.Model):
     __tablename__ = 'supply_chain_stages'
+    __table_args__ = (
+        db.Index('ix_supply_chain_stages_product_id_timestamp', 'product_id', 'timestamp'),
+        db.Index('ix_supply_chain_stages_timestamp', 'timestamp'),
+    )
     id = db.Column(db.String, primary_key=True, default=lambda: os.urandom(8).hex().lower())
-    product_id = db.Column(db.String, nullable=False)
+    product_id = db.Column(db.String, db.ForeignKey('products.id'), nullable=False)
     stage_name = db.Column(db.String, nullable=False)
     stage_type = db.Column(db.String, nullable=False)
-    handler_id = db.Column(db.String, nullable=False)
+    handler_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
     location = db.Column(db.String)
     timestamp = db.Column(db.Integer, default=lambda: int(time.time()))
     notes = db.Column(db.String)
     verification_data = db.Column(db.String)
     status = db.Column(db.String, default='completed')
 
+    product = db.relationship('Product', back_populates='stages')
+
+    api_fields = {
+        'id': ('id', None), 'productId': ('product_id', None), 'stageName': ('stage_name', None),
+        'stageType': ('stage_type', None), 'handlerId': ('handler_id', None), 'location': ('location', None),
+        'timestamp': ('timestamp', None), 'notes': ('notes', None),
+        'verificationData': ('verification_data', None), 'status': ('status', None)
+    }
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -125,10 +203,17 @@ class SupplyChainStage(db.Model):
 
 class Transaction(db.Model):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        db.Index('ix_transactions_product_id_created_at_id', 'product_id', 'created_at', 'id'),
+        db.Index('ix_transactions_from_user_id_created_at_id', 'from_user_id', 'created_at', 'id'),
+        db.Index('ix_transactions_to_user_id_created_at_id', 'to_user_id', 'created_at', 'id'),
+        db.Index('ix_transactions_status', 'status'),
+        db.Index('ix_transactions_created_at', 'created_at'),
+    )
     id = db.Column(db.String, primary_key=True, default=lambda: os.urandom(8).hex().lower())
-    product_id = db.Column(db.String, nullable=False)
-    from_user_id = db.Column(db.String, nullable=False)
-    to_user_id = db.Column(db.String, nullable=False)
+    product_id = db.Column(db.String, db.ForeignKey('products.id'), nullable=False)
+    from_user_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
+    to_user_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
     transaction_type = db.Column(db.String, nullable=False)
     quantity = db.Column(db.Float, nullable=False)
     price = db.Column(db.Float)
@@ -140,6 +225,17 @@ class Transaction(db.Model):
     created_at = db.Column(db.Integer, default=lambda: int(time.time()))
     updated_at = db.Column(db.Integer, default=lambda: int(time.time()))
 
+    product = db.relationship('Product', back_populates='transactions')
+
+    api_fields = {
+        'id': ('id', None), 'productId': ('product_id', None), 'fromUserId': ('from_user_id', None),
+        'toUserId': ('to_user_id', None), 'transactionType': ('transaction_type', None),
+        'quantity': ('quantity', None), 'price': ('price', None), 'currency': ('currency', None),
+        'status': ('status', None), 'blockchainHash': ('blockchain_hash', None),
+        'verificationSignature': ('verification_signature', None), 'metadata': ('tx_metadata', None),
+        'createdAt': ('created_at', None), 'updatedAt': ('updated_at', None)
+    }
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -160,9 +256,12 @@ class Transaction(db.Model):
 
 class Verification(db.Model):
     __tablename__ = 'verifications'
+    __table_args__ = (
+        db.Index('ix_verifications_product_id', 'product_id'),
+    )
     id = db.Column(db.String, primary_key=True, default=lambda: os.urandom(8).hex().lower())
-    product_id = db.Column(db.String, nullable=False)
-    verifier_id = db.Column(db.String, nullable=False)
+    product_id = db.Column(db.String, db.ForeignKey('products.id'), nullable=False)
+    verifier_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
     verification_type = db.Column(db.String, nullable=False)
     result = db.Column(db.String, nullable=False)
     certificate_url = db.Column(db.String)
@@ -170,6 +269,15 @@ class Verification(db.Model):
     valid_until = db.Column(db.Integer)
     created_at = db.Column(db.Integer, default=lambda: int(time.time()))
 
+    product = db.relationship('Product', back_populates='verifications')
+
+    api_fields = {
+        'id': ('id', None), 'productId': ('product_id', None), 'verifierId': ('verifier_id', None),
+        'verificationType': ('verification_type', None), 'result': ('result', None),
+        'certificateUrl': ('certificate_url', None), 'notes': ('notes', None),
+        'validUntil': ('valid_until', iso_date), 'createdAt': ('created_at', None)
+    }
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -179,10 +287,41 @@ class Verification(db.Model):
             'result': self.result,
             'certificateUrl': self.certificate_url,
             'notes': self.notes,
-            'validUntil': datetime.fromtimestamp(self.valid_until).isoformat() if self.valid_until else None,
+            'validUntil': iso_date(self.valid_until),
             'createdAt': self.created_at
         }
 
+class StatsDaily(db.Model):
+    # Maintained by the flush hooks below; farmer_id '*' is everyone, day -1 is all time
+    __tablename__ = 'stats_daily'
+    farmer_id = db.Column(db.String, primary_key=True)
+    day = db.Column(db.Integer, primary_key=True)
+    products = db.Column(db.Integer, nullable=False, default=0)
+    yield_total = db.Column(db.Float, nullable=False, default=0)
+    transactions = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    active_shipments = db.Column(db.Integer, nullable=False, default=0)
+
+class RollupHourly(db.Model):
+    __tablename__ = 'rollup_hourly'
+    event = db.Column(db.String, primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True)
+    product_type = db.Column(db.String, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    quantity = db.Column(db.Float, nullable=False, default=0)
+    amount = db.Column(db.Float, nullable=False, default=0)
+
+class RollupDaily(db.Model):
+    __tablename__ = 'rollup_daily'
+    event = db.Column(db.String, primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True)
+    product_type = db.Column(db.String, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    quantity = db.Column(db.Float, nullable=False, default=0)
+    amount = db.Column(db.Float, nullable=False, default=0)
+
+ROLLUP_TABLES = {'hour': RollupHourly.__table__, 'day': RollupDaily.__table__}
+
 # ==========================================
 # HELPERS
 # ==========================================
@@ -193,6 +332,90 @@ def get_current_user_id():
     # Return user_id from session or None
     return session.get('user_id')
 
+app.config.setdefault('USER_CACHE_TTL', int(os.environ.get('USER_CACHE_TTL', 30)))
+app.config.setdefault('USER_CACHE_SIZE', int(os.environ.get('USER_CACHE_SIZE', 4096)))
+
+def load_user(user_id):
+    rows = select_dicts(User.query.filter_by(id=user_id), User)
+    return rows[0] if rows else None
+
+# Request-scoped current user (on flask.g) over a TTL cache of user records; role checks
+# are the users.login_required / users.roles_required decorators
+users = auth.UserResolver(load_user, ttl=app.config['USER_CACHE_TTL'], max_entries=app.config['USER_CACHE_SIZE'])
+
+def current_user():
+    return users.current()
+
+app.config.setdefault('PAGE_SIZE', 100)
+app.config.setdefault('PAGE_MAX', 1000)
+
+def encode_cursor(created_at, id):
+    return base64.urlsafe_b64encode(json.dumps([created_at, id]).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    # Cursors come back from clients, so anything but a [timestamp, id] pair is rejected
+    value = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    if not (isinstance(value, list) and len(value) == 2 and isinstance(value[1], str)
+            and isinstance(value[0], (int, float)) and not isinstance(value[0], bool)):
+        raise ValueError('Invalid cursor')
+    created_at, id = value
+    return created_at, id
+
+def api_columns(model, fields):
+    return [getattr(model, model.api_fields[f][0]) for f in fields]
+
+@functools.lru_cache(maxsize=None)
+def model_serializer(model, fields, offset=0):
+    return row_serializer([(f, model.api_fields[f][1]) for f in fields], offset)
+
+def select_dicts(query, model, fields=None):
+    """API dicts for the rows of a read-only query, selected column by column.
+
+    Skips building ORM instances (identity map, attribute state) entirely; the output is
+    the same as to_dict() for the fields in model.api_fields.
+    """
+    fields = tuple(fields or model.api_fields)
+    serialize = model_serializer(model, fields)
+    return [serialize(row) for row in query.with_entities(*api_columns(model, fields))]
+
+def list_response(model, *criteria):
+    """Keyset-paginated, optionally projected list of `model` rows, newest first.
+
+    ?limit= caps the page (PAGE_SIZE by default, PAGE_MAX at most), ?cursor= continues
+    after the last row of the previous page and ?fields= picks API fields from
+    model.api_fields so only those columns are selected. The body stays a plain array;
+    the next page is advertised in X-Next-Cursor and a Link header.
+    """
+    limit = min(max(request.args.get('limit', app.config['PAGE_SIZE'], type=int), 1), app.config['PAGE_MAX'])
+    fields = [f for f in request.args.get('fields', '').split(',') if f]
+    unknown = [f for f in fields if f not in model.api_fields]
+    if unknown:
+        return jsonify({'message': f"Unknown fields: {', '.join(unknown)}"}), 400
+
+    query = model.query.filter(*criteria)
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except (ValueError, TypeError):
+            return jsonify({'message': 'Invalid cursor'}), 400
+        query = query.filter(tuple_(model.created_at, model.id) < after)
+    query = query.order_by(model.created_at.desc(), model.id.desc())
+
+    fields = tuple(fields or model.api_fields)
+    rows = query.with_entities(model.created_at, model.id, *api_columns(model, fields)).limit(limit + 1).all()
+    serialize = model_serializer(model, fields, 2)
+    response = jsonify([serialize(row) for row in rows[:limit]])
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+        # The same URL and query with the cursor swapped; query args never reach url_for, where
+        # names clashing with view args (or _external, _anchor) would break the build
+        args = [(k, v) for k, v in request.args.items(multi=True) if k != 'cursor'] + [('cursor', next_cursor)]
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return response
+
 def seed_db():
     users = [
         User(id="00000000000000000000000000000001", email="farmer@example.com", first_name="John", last_name="Doe", role="farmer", company_name="Green Valley Farms", location="California, USA", verification_status="verified"),
@@ -211,8 +434,9 @@ def seed_db():
     db.session.commit()
 
 class QRCodeService:
-    def __init__(self, base_url='http://localhost:5000'):
+    def __init__(self, base_url='http://localhost:5000', cache=None):
         self.base_url = base_url
+        self.cache = cache or QRRenderCache()
 
     def generate_qr_data(self, product, farmer_name):
         return {
@@ -220,15 +444,17 @@ class QRCodeService:
             'batchNumber': product.batch_number,
             'name': product.name,
             'farmer': farmer_name,
-            'harvestDate': datetime.fromtimestamp(product.harvest_date).isoformat() if product.harvest_date else None,
+            'harvestDate': iso_date(product.harvest_date),
             'status': product.status,
             'verificationUrl': f"{self.base_url}/verify/{product.batch_number}",
             'trackingUrl': f"{self.base_url}/track/{product.batch_number}",
             'timestamp': int(time.time() * 1000)
         }
 
-    def generate_qr_code(self, qr_data_dict):
-        qr_content = json.dumps({
+    @staticmethod
+    def qr_content(qr_data_dict):
+        # The per-call timestamp is left out so identical product state encodes (and caches) identically
+        return json.dumps({
             'id': qr_data_dict['productId'],
             'batch': qr_data_dict['batchNumber'],
             'name': qr_data_dict['name'],
@@ -236,30 +462,250 @@ class QRCodeService:
             'harvest': qr_data_dict['harvestDate'],
             'status': qr_data_dict['status'],
             'verify': qr_data_dict['verificationUrl'],
-            'track': qr_data_dict['trackingUrl'],
-            'timestamp': qr_data_dict['timestamp']
-        })
-        qr = qrcode.QRCode(version=1, box_size=10, border=1)
-        qr.add_data(qr_content)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white")
-        buffered = io.BytesIO()
-        img.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        return f"data:image/png;base64,{img_str}"
-
-    def generate_tracking_qr(self, batch_number):
-        tracking_url = f"{self.base_url}/lookup/{batch_number}"
-        qr = qrcode.QRCode(version=1, box_size=10, border=1)
-        qr.add_data(tracking_url)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="#10B981", back_color="white")
-        buffered = io.BytesIO()
-        img.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        return f"data:image/png;base64,{img_str}"
-
-qr_service = QRCodeService()
+            'track': qr_data_dict['trackingUrl']
+        }, sort_keys=True)
+
+    renderers = {'png': render_qr_png, 'svg': render_qr_svg}
+
+    def cache_key(self, content, fill_color, fmt='png'):
+        return self.cache.make_key(fmt, fill_color, content)
+
+    def _cached_image(self, content, fill_color, fmt='png', product_id=None):
+        key = self.cache_key(content, fill_color, fmt)
+        image = self.cache.get_or_render(key, lambda: self.renderers[fmt](content, fill_color), product_id)
+        return key, image
+
+    def tracking_content(self, batch_number):
+        return f"{self.base_url}/lookup/{batch_number}"
+
+    def qr_image(self, qr_data_dict, fmt='png'):
+        return self._cached_image(self.qr_content(qr_data_dict), "black", fmt, qr_data_dict['productId'])
+
+    def tracking_image(self, batch_number, fmt='png', product_id=None):
+        return self._cached_image(self.tracking_content(batch_number), "#10B981", fmt, product_id)
+
+    def generate_qr_pngs(self, qr_data_dicts):
+        """Cached PNGs for many products; only cache misses are rendered, in a process pool."""
+        contents = [self.qr_content(d) for d in qr_data_dicts]
+        keys = [self.cache_key(c, "black") for c in contents]
+        pngs = [self.cache.get(k, d['productId']) for k, d in zip(keys, qr_data_dicts)]
+        missing = [i for i, png in enumerate(pngs) if png is None]
+        for i, png in zip(missing, render_many([(contents[i], "black") for i in missing])):
+            self.cache.put(keys[i], png, qr_data_dicts[i]['productId'])
+            pngs[i] = png
+        return pngs
+
+    @staticmethod
+    def data_uri(png):
+        return f"data:image/png;base64,{base64.b64encode(png).decode()}"
+
+    def generate_qr_code(self, qr_data_dict):
+        return self.data_uri(self.qr_image(qr_data_dict)[1])
+
+    def generate_tracking_qr(self, batch_number, product_id=None):
+        return self.data_uri(self.tracking_image(batch_number, 'png', product_id)[1])
+
+app.config.setdefault('QR_CACHE_SIZE', int(os.environ.get('QR_CACHE_SIZE', 2048)))
+app.config.setdefault('QR_CACHE_DIR', os.environ.get('QR_CACHE_DIR'))
+
+qr_service = QRCodeService(cache=QRRenderCache(
+    max_entries=app.config['QR_CACHE_SIZE'], disk_dir=app.config['QR_CACHE_DIR']
+))
+
+@event.listens_for(Product, 'after_update')
+def invalidate_product_qr(mapper, connection, product):
+    if inspect(product).attrs.status.history.has_changes():
+        qr_service.cache.invalidate_product(product.id)
+
+# Tags are invalidated only in the process that made the change, so reader workers would
+# serve another worker's stale document until the TTL; they don't cache unless told to
+app.config.setdefault('LOOKUP_CACHE_SIZE', int(os.environ.get(
+    'LOOKUP_CACHE_SIZE', 0 if app.config['CHAIN_ROLE'] == 'reader' else 4096)))
+app.config.setdefault('LOOKUP_CACHE_TTL', int(os.environ.get('LOOKUP_CACHE_TTL', 60)))
+
+lookup_cache = TaggedCache(max_entries=app.config['LOOKUP_CACHE_SIZE'], ttl=app.config['LOOKUP_CACHE_TTL'])
+
+app.config.setdefault('TIMELINE_CACHE_SIZE', int(os.environ.get('TIMELINE_CACHE_SIZE', 4096)))
+app.config.setdefault('TIMELINE_CACHE_TTL', int(os.environ.get('TIMELINE_CACHE_TTL', 300)))
+app.config.setdefault('TIMELINE_CACHE_URL', os.environ.get('TIMELINE_CACHE_URL'))
+app.config.setdefault('TIMELINE_COMPACT_AFTER', int(os.environ.get('TIMELINE_COMPACT_AFTER', 100)))
+app.config.setdefault('TIMELINE_KEEP_RECENT', int(os.environ.get('TIMELINE_KEEP_RECENT', 20)))
+
+def load_timeline(product_id):
+    return select_dicts(SupplyChainStage.query.filter_by(product_id=product_id)
+                        .order_by(SupplyChainStage.timestamp), SupplyChainStage)
+
+# In-process by default; TIMELINE_CACHE_URL=redis://... shares timelines between workers.
+# Generations only advance in the process that wrote, so reader workers without a shared
+# backend load every timeline from the database rather than serve another worker's copy.
+if app.config['TIMELINE_CACHE_URL']:
+    timeline_backend = RedisBackend.from_url(app.config['TIMELINE_CACHE_URL'])
+elif app.config['CHAIN_ROLE'] == 'reader':
+    timeline_backend = NullBackend()
+else:
+    timeline_backend = MemoryBackend(max_entries=app.config['TIMELINE_CACHE_SIZE'])
+
+timelines = TimelineCache(
+    load_timeline,
+    backend=timeline_backend,
+    ttl=app.config['TIMELINE_CACHE_TTL'],
+    compact_after=app.config['TIMELINE_COMPACT_AFTER'],
+    keep_recent=app.config['TIMELINE_KEEP_RECENT']
+)
+
+@event.listens_for(OrmSession, 'after_flush')
+def collect_timeline_changes(session, flush_context):
+    # New stages are appended to cached timelines; edits and deletes drop them
+    appends = session.info.setdefault('timeline_appends', {})
+    stale = session.info.setdefault('timeline_stale', set())
+    for obj in session.new:
+        if isinstance(obj, SupplyChainStage):
+            appends.setdefault(obj.product_id, []).append(obj.to_dict())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, SupplyChainStage):
+            moved = attribute_change(obj, 'product_id')
+            stale.update(moved if moved else (obj.product_id,))
+        elif isinstance(obj, Product) and obj in session.deleted:
+            stale.add(obj.id)
+
+# Registered before invalidate_cache_tags, so a lookup document rebuilt right after the
+# commit already sees the appended stage
+@event.listens_for(OrmSession, 'after_commit')
+def apply_timeline_changes(session):
+    appends = session.info.pop('timeline_appends', None) or {}
+    stale = session.info.pop('timeline_stale', None) or set()
+    for product_id, stages in appends.items():
+        if product_id not in stale:
+            timelines.append(product_id, sorted(stages, key=lambda s: s['timestamp'] or 0))
+    if stale:
+        timelines.invalidate(*(pid for pid in stale if pid))
+
+@event.listens_for(OrmSession, 'after_rollback')
+def discard_timeline_changes(session):
+    session.info.pop('timeline_appends', None)
+    session.info.pop('timeline_stale', None)
+
+app.config.setdefault('EVENTS_BUFFER_SIZE', int(os.environ.get('EVENTS_BUFFER_SIZE', 256)))
+app.config.setdefault('EVENTS_HISTORY', int(os.environ.get('EVENTS_HISTORY', 1024)))
+app.config.setdefault('EVENTS_MAX_SUBSCRIBERS', int(os.environ.get('EVENTS_MAX_SUBSCRIBERS', 1000)))
+app.config.setdefault('EVENTS_HEARTBEAT', int(os.environ.get('EVENTS_HEARTBEAT', 15)))
+
+broker = events.EventBroker(
+    buffer_size=app.config['EVENTS_BUFFER_SIZE'], history=app.config['EVENTS_HISTORY'],
+    max_subscribers=app.config['EVENTS_MAX_SUBSCRIBERS'], encode=app.json.dumps
+)
+
+@event.listens_for(OrmSession, 'after_flush')
+def collect_events(session, flush_context):
+    pending = session.info.setdefault('events', [])
+    for obj in session.new:
+        if isinstance(obj, SupplyChainStage):
+            pending.append(('stage', obj.to_dict(), (obj.product_id,)))
+        elif isinstance(obj, Transaction):
+            pending.append(('transaction', obj.to_dict(), (obj.product_id,)))
+    for obj in session.dirty:
+        if isinstance(obj, Transaction) and attribute_change(obj, 'status'):
+            pending.append(('transaction', obj.to_dict(), (obj.product_id,)))
+
+@event.listens_for(OrmSession, 'after_commit')
+def publish_events(session):
+    for event_type, data, product_ids in session.info.pop('events', None) or ():
+        broker.publish(event_type, data, product_ids)
+
+@event.listens_for(OrmSession, 'after_rollback')
+def discard_events(session):
+    session.info.pop('events', None)
+
+def mark_products_changed(session, product_ids):
+    session.info.setdefault('cache_tags', set()).update(f'product:{pid}' for pid in product_ids)
+
+@event.listens_for(OrmSession, 'after_flush')
+def collect_cache_tags(session, flush_context):
+    # Anything that feeds a lookup document tags its product (or farmer) for invalidation
+    tags = session.info.setdefault('cache_tags', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (SupplyChainStage, Transaction, Verification)):
+            tags.add(f'product:{obj.product_id}')
+        elif isinstance(obj, Product):
+            tags.add(f'product:{obj.id}')
+        elif isinstance(obj, User):
+            tags.add(f'user:{obj.id}')
+
+@event.listens_for(OrmSession, 'after_commit')
+def invalidate_cache_tags(session):
+    # Only after commit, so a concurrent reader cannot re-cache the pre-commit state
+    tags = session.info.pop('cache_tags', None)
+    if tags:
+        lookup_cache.invalidate(*tags)
+        users.invalidate(*(tag for tag in tags if tag.startswith('user:')))
+
+@event.listens_for(OrmSession, 'after_rollback')
+def discard_cache_tags(session):
+    session.info.pop('cache_tags', None)
+
+def attribute_change(obj, name):
+    # (old, new) for a flushed attribute change, or None if it did not change
+    history = inspect(obj).attrs[name].history
+    if not history.has_changes():
+        return None
+    return (history.deleted[0] if history.deleted else None, history.added[0] if history.added else None)
+
+@event.listens_for(OrmSession, 'after_flush')
+def collect_stats(session, flush_context):
+    # Upserted on the flush's own connection, so the counters commit or roll back with the rows
+    delta = analytics.StatsDelta()
+    rollups = analytics.RollupDelta()
+    stages, events = [], []
+    for obj, sign in [(o, 1) for o in session.new] + [(o, -1) for o in session.deleted]:
+        if isinstance(obj, Product):
+            delta.add(obj.created_by, obj.created_at, products=sign, yield_total=sign * (obj.quantity or 0))
+            rollups.add('product_created', obj.product_type, obj.created_at, count=sign, quantity=sign * (obj.quantity or 0))
+        elif isinstance(obj, Transaction):
+            revenue = 0 if obj.status == 'failed' else analytics.revenue_of(obj.price, obj.quantity)
+            delta.add(obj.from_user_id, obj.created_at, transactions=sign, revenue=sign * revenue)
+            events.append((obj, sign))
+        elif isinstance(obj, SupplyChainStage):
+            if obj.status in analytics.ACTIVE_STAGE_STATUSES:
+                stages.append((obj, sign))
+            events.append((obj, sign))
+    for obj in session.dirty:
+        if isinstance(obj, Product):
+            change = attribute_change(obj, 'quantity')
+            if change:
+                delta.add(obj.created_by, obj.created_at, yield_total=(change[1] or 0) - (change[0] or 0))
+        elif isinstance(obj, Transaction):
+            status, price, quantity = (attribute_change(obj, name) for name in ('status', 'price', 'quantity'))
+            if status or price or quantity:
+                old_status = status[0] if status else obj.status
+                old = 0 if old_status == 'failed' else analytics.revenue_of(
+                    price[0] if price else obj.price, quantity[0] if quantity else obj.quantity)
+                new = 0 if obj.status == 'failed' else analytics.revenue_of(obj.price, obj.quantity)
+                delta.add(obj.from_user_id, obj.created_at, revenue=new - old)
+        elif isinstance(obj, SupplyChainStage):
+            status = attribute_change(obj, 'status')
+            if status:
+                was, now = (st in analytics.ACTIVE_STAGE_STATUSES for st in status)
+                if was != now:
+                    stages.append((obj, 1 if now else -1))
+    if stages or events:
+        product_ids = {o.product_id for o, _ in stages} | {o.product_id for o, _ in events}
+        products = {row.id: row for row in session.connection().execute(
+            select(Product.id, Product.created_by, Product.product_type).where(Product.id.in_(product_ids))
+        )}
+        for stage, sign in stages:
+            owner = products.get(stage.product_id)
+            delta.add(owner and owner.created_by, stage.timestamp, active_shipments=sign)
+        for obj, sign in events:
+            product_type = products[obj.product_id].product_type if obj.product_id in products else None
+            if isinstance(obj, Transaction):
+                rollups.add('transaction', product_type, obj.created_at, count=sign, quantity=sign * (obj.quantity or 0),
+                            amount=sign * analytics.revenue_of(obj.price, obj.quantity))
+            else:
+                rollups.add('stage', product_type, obj.timestamp, count=sign)
+    if delta:
+        delta.apply(session.connection(), StatsDaily.__table__)
+    if rollups:
+        rollups.apply(session.connection(), ROLLUP_TABLES)
 
 # ==========================================
 # ROUTES
@@ -273,19 +719,22 @@ def global_logout():
     return redirect('/login')
 
 @app.route('/api/farmer/stats', methods=['GET'])
+@users.login_required
 def get_farmer_stats():
-    user_id = get_current_user_id()
-    if not user_id: return jsonify({'message': 'Unauthorized'}), 401
-    
-    products = Product.query.filter_by(created_by=user_id).count()
-    # Mocking other stats as we don't have tables for them yet
+    user_id = current_user()['id']
+
+    # Two 30-day windows of per-day rows at most, regardless of table size
+    now = int(time.time())
+    totals, days = analytics.read(db.session.connection(), StatsDaily.__table__, user_id, since=now - 60 * 86400)
+    recent = sum(d['revenue'] for d in days if d['day'] >= analytics.day_of(now - 30 * 86400))
+    previous = sum(d['revenue'] for d in days) - recent
     return jsonify({
-        'activeCrops': products,
-        'totalProducts': products,
-        'monthlyRevenue': 15000,
-        'growthRate': '12.5%',
-        'totalYield': '12.5 tons',
-        'alerts': 2
+        'activeCrops': totals['products'],
+        'totalProducts': totals['products'],
+        'monthlyRevenue': round(recent, 2),
+        'growthRate': round((recent - previous) / previous * 100, 1) if previous else 0,
+        'totalYield': round(totals['yield_total'], 2),
+        'activeShipments': totals['active_shipments']
     })
 
 @app.route('/api/farmer/products', methods=['GET'])
@@ -334,7 +783,8 @@ def login():
     user = User.query.filter_by(email=email).first()
     if user:
         session['user_id'] = user.id
-        return jsonify(user.to_dict())
+        g._current_user = user.to_dict()
+        return jsonify(g._current_user)
     
     return jsonify({'message': 'Invalid credentials'}), 401
 
@@ -345,68 +795,65 @@ def logout():
 
 @app.route('/api/auth/user', methods=['GET'])
 def get_user():
-    user_id = get_current_user_id()
-    if not user_id:
+    if not get_current_user_id():
         return jsonify({'message': 'Unauthorized'}), 401
-    user = User.query.get(user_id)
-    if user: return jsonify(user.to_dict())
+    user = current_user()
+    if user: return jsonify(user)
     return jsonify({'message': 'User not found'}), 404
 
 # PRODUCTS
 @app.route('/api/products', methods=['GET'])
 def get_products():
-    user_id = get_current_user_id()
-    user = User.query.get(user_id)
-    if user and user.role == 'farmer':
-        products = Product.query.filter_by(created_by=user_id).all()
-    else:
-        products = Product.query.all()
-    return jsonify([p.to_dict() for p in products])
+    user = current_user()
+    if user and user['role'] == 'farmer':
+        return list_response(Product, Product.created_by == user['id'])
+    return list_response(Product)
 
 @app.route('/api/products/recent', methods=['GET'])
 def get_recent_products():
-    user_id = get_current_user_id()
-    user = User.query.get(user_id)
+    user = current_user()
     limit = int(request.args.get('limit', 10))
     
     query = Product.query
-    if user and user.role == 'farmer':
-        query = query.filter_by(created_by=user_id)
+    if user and user['role'] == 'farmer':
+        query = query.filter_by(created_by=user['id'])
         
-    products = query.order_by(Product.created_at.desc()).limit(limit).all()
-    return jsonify([p.to_dict() for p in products])
+    return jsonify(select_dicts(query.order_by(Product.created_at.desc()).limit(limit), Product))
 
 @app.route('/api/products/by-status/<status>', methods=['GET'])
 def get_products_by_status(status):
-    user_id = get_current_user_id()
-    user = User.query.get(user_id)
-    query = Product.query.filter_by(status=status)
-    if user and user.role == 'farmer':
-        query = query.filter_by(created_by=user_id)
-    products = query.all()
-    return jsonify([p.to_dict() for p in products])
+    user = current_user()
+    criteria = [Product.status == status]
+    if user and user['role'] == 'farmer':
+        criteria.append(Product.created_by == user['id'])
+    return list_response(Product, *criteria)
 
 @app.route('/api/products/by-type/<product_type>', methods=['GET'])
 def get_products_by_type(product_type):
-    user_id = get_current_user_id()
-    user = User.query.get(user_id)
-    query = Product.query.filter_by(product_type=product_type)
-    if user and user.role == 'farmer':
-        query = query.filter_by(created_by=user_id)
-    products = query.all()
-    return jsonify([p.to_dict() for p in products])
+    user = current_user()
+    criteria = [Product.product_type == product_type]
+    if user and user['role'] == 'farmer':
+        criteria.append(Product.created_by == user['id'])
+    return list_response(Product, *criteria)
 
 @app.route('/api/search/products', methods=['GET'])
 def search_products():
-    q = request.args.get('q', '')
+    q = request.args.get('q', '').strip()
     if not q:
         return jsonify([])
-    
-    products = Product.query.filter(or_(
-        Product.name.ilike(f'%{q}%'),
-        Product.batch_number.ilike(f'%{q}%')
-    )).limit(50).all()
-    return jsonify([p.to_dict() for p in products])
+
+    ids = search.search_product_ids(db.session.connection(), q, 50, product_search_uses_fts())
+    by_id = {p['id']: p for p in select_dicts(Product.query.filter(Product.id.in_(ids)), Product)} if ids else {}
+    return jsonify([by_id[i] for i in ids if i in by_id])
+
+_search_fts = None
+
+def product_search_uses_fts():
+    # The FTS table only exists once migration 0003 has run on an FTS5-capable SQLite
+    global _search_fts
+    if _search_fts is None:
+        _search_fts = db.engine.dialect.name == 'sqlite' and search.has_fts_table(db.session.connection())
+    return _search_fts
 
 @app.route('/api/products/<id>', methods=['GET'])
 def get_product(id):
@@ -434,7 +881,7 @@ def create_product():
         status='created', created_by=user_id
     )
     db.session.add(product)
-    db.session.commit()
+    db.session.flush()
 
     stage = SupplyChainStage(
         product_id=product.id, stage_name="Farm Production", stage_type="production",
@@ -445,53 +892,176 @@ def create_product():
     db.session.commit()
     return jsonify(product.to_dict()), 201
 
+app.config.setdefault('BULK_CHUNK_SIZE', 5000)
+
+@app.route('/api/products/bulk', methods=['POST'])
+def create_products_bulk():
+    """Create many products (plus their Farm Production stage) from a JSON array, NDJSON or CSV.
+
+    Rows are validated and inserted a chunk at a time, one transaction per chunk, so a
+    streamed upload never sits in memory whole. Invalid rows are skipped and reported.
+    """
+    user_id = get_current_user_id()
+    if not user_id:
+        return jsonify({'message': 'Unauthorized'}), 401
+    content_type = request.mimetype
+    json_body = request.get_json(silent=True) if content_type == 'application/json' else None
+    errors, inserted, seen_batches, offset = [], 0, set(), 0
+    try:
+        rows = ingest.iter_rows(request.stream, content_type, json_body)
+        for chunk in ingest.chunks(rows, app.config['BULK_CHUNK_SIZE']):
+            valid, chunk_errors = ingest.validate_chunk(chunk)
+            errors.extend({'row': offset + i, 'errors': problems} for i, problems in chunk_errors)
+
+            batch_numbers = [fields['batch_number'] for _, fields in valid]
+            existing = {b for (b,) in db.session.query(Product.batch_number)
+                        .filter(Product.batch_number.in_(batch_numbers))} if batch_numbers else set()
+            now = int(time.time())
+            products, stages, accepted = [], [], []
+            for i, fields in valid:
+                batch_number = fields['batch_number']
+                if batch_number in existing or batch_number in seen_batches:
+                    errors.append({'row': offset + i, 'errors': [f'batchNumber {batch_number} already exists']})
+                    continue
+                seen_batches.add(batch_number)
+                accepted.append(offset + i)
+                product_id = os.urandom(8).hex().lower()
+                location = fields.pop('location')
+                products.append(dict(fields, id=product_id, origin_farm_id=user_id, status='created',
+                                     qr_code=None, created_by=user_id, created_at=now, updated_at=now))
+                stages.append({
+                    'id': os.urandom(8).hex().lower(), 'product_id': product_id,
+                    'stage_name': "Farm Production", 'stage_type': "production", 'handler_id': user_id,
+                    'location': location, 'timestamp': now,
+                    'notes': "Product created and registered on farm", 'verification_data': None,
+                    'status': "completed"
+                })
+            if products:
+                try:
+                    with search.bulk_index(db.session.connection(), product_search_uses_fts()):
+                        db.session.execute(Product.__table__.insert(), products)
+                        db.session.execute(SupplyChainStage.__table__.insert(), stages)
+                    # Core inserts skip the flush hooks, so the counters are fed directly
+                    delta = analytics.StatsDelta()
+                    for p in products:
+                        delta.add(user_id, now, products=1, yield_total=p['quantity'])
+                    delta.apply(db.session.connection(), StatsDaily.__table__)
+                    rollups = analytics.RollupDelta()
+                    for p in products:
+                        rollups.add('product_created', p['product_type'], now, quantity=p['quantity'])
+                        rollups.add('stage', p['product_type'], now)
+                    rollups.apply(db.session.connection(), ROLLUP_TABLES)
+                    # ... and the stage events, which publish_events sends once the chunk commits
+                    db.session.info.setdefault('events', []).extend(
+                        ('stage', SupplyChainStage(**stage).to_dict(), (stage['product_id'],)) for stage in stages)
+                    db.session.commit()
+                    inserted += len(products)
+                except IntegrityError as e:
+                    # Lost a race with another writer; the whole chunk rolls back together
+                    db.session.rollback()
+                    seen_batches.difference_update(p['batch_number'] for p in products)
+                    errors.extend({'row': row, 'errors': [f'Not inserted: {e.orig}']} for row in accepted)
+            offset += len(chunk)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        db.session.rollback()
+        return jsonify({'message': str(e), 'inserted': inserted}), 400
+
+    errors.sort(key=lambda e: e['row'])
+    return jsonify({'inserted': inserted, 'failed': len(errors), 'errors': errors}), 201 if inserted or not errors else 400
+
 # USERS
 @app.route('/api/users', methods=['GET'])
+@users.roles_required('admin', 'inspector')
 def get_users():
-    user_id = get_current_user_id()
-    user = User.query.get(user_id)
-    # Check if admin or inspector
-    if user and user.role in ['admin', 'inspector']:
-        users = User.query.all()
-        return jsonify([u.to_dict() for u in users])
-    return jsonify({'message': 'Unauthorized'}), 403
+    return jsonify(select_dicts(User.query, User))
 
 # QR
+QR_IMAGE_MIMETYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+app.config.setdefault('QR_IMAGE_MAX_AGE', 300)
+
+def product_qr_data(product):
+    farmer = users.get(product.created_by)
+    farmer_name = f"{farmer['firstName']} {farmer['lastName']}" if farmer else "Unknown"
+    return qr_service.generate_qr_data(product, farmer_name)
+
+def wants_image_url():
+    # ?image=url returns a cacheable image URL instead of an inline base64 data URI
+    return request.args.get('image') == 'url'
+
+def qr_image_url(endpoint, product, key, fmt='png'):
+    return url_for(endpoint, id=product.id, fmt=fmt, v=key)
+
+def product_qr_image(product, qr_data):
+    if wants_image_url():
+        key = qr_service.cache_key(qr_service.qr_content(qr_data), "black")
+        return qr_image_url('get_product_qr_image', product, key)
+    return qr_service.generate_qr_code(qr_data)
+
+def qr_image_response(key, image, fmt):
+    response = Response(image, mimetype=QR_IMAGE_MIMETYPES[fmt])
+    response.set_etag(key)
+    response.cache_control.public = True
+    if request.args.get('v') == key:
+        # Versioned URLs always name the same bytes
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.max_age = app.config['QR_IMAGE_MAX_AGE']
+    return response.make_conditional(request)
+
 @app.route('/api/products/<id>/qr', methods=['GET'])
 def get_product_qr(id):
     product = Product.query.get(id)
     if not product: return jsonify({'message': 'Product not found'}), 404
-    farmer = User.query.get(product.created_by)
-    farmer_name = f"{farmer.first_name} {farmer.last_name}" if farmer else "Unknown"
-    qr_data = qr_service.generate_qr_data(product, farmer_name)
-    qr_image = qr_service.generate_qr_code(qr_data)
-    return jsonify({'qrCode': qr_image, 'qrData': qr_data})
+    qr_data = product_qr_data(product)
+    return jsonify({'qrCode': product_qr_image(product, qr_data), 'qrData': qr_data})
+
+@app.route('/api/products/<id>/qr/image.<fmt>', methods=['GET'])
+def get_product_qr_image(id, fmt):
+    if fmt not in QR_IMAGE_MIMETYPES: return jsonify({'message': 'Unsupported image format'}), 404
+    product = Product.query.get(id)
+    if not product: return jsonify({'message': 'Product not found'}), 404
+    key, image = qr_service.qr_image(product_qr_data(product), fmt)
+    return qr_image_response(key, image, fmt)
 
 @app.route('/api/products/<id>/qr/tracking', methods=['GET'])
 def get_tracking_qr(id):
     product = Product.query.get(id)
     if not product: return jsonify({'message': 'Product not found'}), 404
-    tracking_qr = qr_service.generate_tracking_qr(product.batch_number)
+    if wants_image_url():
+        key = qr_service.cache_key(qr_service.tracking_content(product.batch_number), "#10B981")
+        tracking_qr = qr_image_url('get_tracking_qr_image', product, key)
+    else:
+        tracking_qr = qr_service.generate_tracking_qr(product.batch_number, product.id)
     return jsonify({'trackingQR': tracking_qr, 'batchNumber': product.batch_number})
 
+@app.route('/api/products/<id>/qr/tracking/image.<fmt>', methods=['GET'])
+def get_tracking_qr_image(id, fmt):
+    if fmt not in QR_IMAGE_MIMETYPES: return jsonify({'message': 'Unsupported image format'}), 404
+    product = Product.query.get(id)
+    if not product: return jsonify({'message': 'Product not found'}), 404
+    key, image = qr_service.tracking_image(product.batch_number, fmt, product.id)
+    return qr_image_response(key, image, fmt)
+
+def label_product_info(product):
+    return {
+        'name': product.name,
+        'batchNumber': product.batch_number,
+        'productType': product.product_type,
+        'quantity': f"{product.quantity} {product.unit}",
+        'harvestDate': datetime.fromtimestamp(product.harvest_date).strftime('%Y-%m-%d') if product.harvest_date else 'N/A',
+        'expiryDate': datetime.fromtimestamp(product.expiry_date).strftime('%Y-%m-%d') if product.expiry_date else 'N/A',
+        'status': product.status.replace('_', ' ').upper()
+    }
+
 @app.route('/api/products/<id>/label', methods=['GET'])
 def get_product_label(id):
     product = Product.query.get(id)
     if not product: return jsonify({'message': 'Product not found'}), 404
-    farmer = User.query.get(product.created_by)
-    farmer_name = f"{farmer.first_name} {farmer.last_name}" if farmer else "Unknown"
-    qr_data = qr_service.generate_qr_data(product, farmer_name)
-    qr_image = qr_service.generate_qr_code(qr_data)
+    qr_data = product_qr_data(product)
+    qr_image = product_qr_image(product, qr_data)
     label = {
-        'productInfo': {
-            'name': product.name,
-            'batchNumber': product.batch_number,
-            'productType': product.product_type,
-            'quantity': f"{product.quantity} {product.unit}",
-            'harvestDate': datetime.fromtimestamp(product.harvest_date).strftime('%Y-%m-%d') if product.harvest_date else 'N/A',
-            'expiryDate': datetime.fromtimestamp(product.expiry_date).strftime('%Y-%m-%d') if product.expiry_date else 'N/A',
-            'status': product.status.replace('_', ' ').upper()
-        },
+        'productInfo': label_product_info(product),
         'qrCode': {'image': qr_image, 'data': qr_data},
         'instructions': {'consumer': 'Scan QR code to verify', 'retailer': 'Use batch number for inventory'},
         'generatedAt': datetime.now().isoformat(),
@@ -499,6 +1069,56 @@ def get_product_label(id):
     }
     return jsonify(label)
 
+app.config.setdefault('LABEL_BATCH_MAX', 10000)
+
+@app.route('/api/labels/batch', methods=['POST'])
+def create_label_batch():
+    data = request.json
+    if not isinstance(data, dict):
+        return jsonify({'message': 'Expected a JSON object'}), 400
+    product_ids = data.get('productIds')
+    prefix = data.get('batchPrefix')
+    output = data.get('format', 'zip')
+    if product_ids is not None and not (isinstance(product_ids, list) and all(isinstance(i, str) for i in product_ids)):
+        return jsonify({'message': 'productIds must be a list of strings'}), 400
+    if product_ids and len(product_ids) > app.config['LABEL_BATCH_MAX']:
+        return jsonify({'message': f"At most {app.config['LABEL_BATCH_MAX']} productIds per batch"}), 400
+    if prefix is not None and not isinstance(prefix, str):
+        return jsonify({'message': 'batchPrefix must be a string'}), 400
+    if not product_ids and not prefix:
+        return jsonify({'message': 'productIds or batchPrefix is required'}), 400
+    if output not in ('zip', 'pdf'):
+        return jsonify({'message': 'format must be zip or pdf'}), 400
+
+    # One query for every product and its farmer instead of two lookups per label
+    query = db.session.query(Product, User).outerjoin(User, User.id == Product.created_by)
+    if product_ids:
+        query = query.filter(Product.id.in_(product_ids))
+    else:
+        query = query.filter(Product.batch_number.startswith(prefix, autoescape=True))
+    rows = query.order_by(Product.batch_number).limit(app.config['LABEL_BATCH_MAX'] + 1).all()
+    if not rows:
+        return jsonify({'message': 'No matching products'}), 404
+    if len(rows) > app.config['LABEL_BATCH_MAX']:
+        return jsonify({'message': f"At most {app.config['LABEL_BATCH_MAX']} labels per batch"}), 413
+
+    qr_data = [
+        qr_service.generate_qr_data(product, f"{farmer.first_name} {farmer.last_name}" if farmer else "Unknown")
+        for product, farmer in rows
+    ]
+    pngs = qr_service.generate_qr_pngs(qr_data)
+    labels = [{'productInfo': label_product_info(product), 'qrData': d} for (product, _), d in zip(rows, qr_data)]
+
+    if output == 'pdf':
+        return send_file(build_sheet(labels, pngs), mimetype='application/pdf',
+                         as_attachment=True, download_name='labels.pdf')
+    return send_file(build_zip(labels, pngs), mimetype='application/zip',
+                     as_attachment=True, download_name='labels.zip')
+
+@app.route('/api/qr/cache/stats', methods=['GET'])
+def get_qr_cache_stats():
+    return jsonify(qr_service.cache.stats())
+
 @app.route('/track/<batch_number>')
 def track_redirect(batch_number):
     return redirect(f'/?track={batch_number}')
@@ -510,8 +1130,10 @@ def verify_redirect(batch_number):
 # Supply Chain
 @app.route('/api/products/<id>/supply-chain', methods=['GET'])
 def get_supply_chain(id):
-    stages = SupplyChainStage.query.filter_by(product_id=id).all()
-    return jsonify([s.to_dict() for s in stages])
+    # ?view=compact returns the consumer timeline, with long runs of stages summarised
+    if request.args.get('view') == 'compact':
+        return jsonify(timelines.view(id))
+    return jsonify(timelines.full(id))
 
 @app.route('/api/products/<id>/supply-chain', methods=['POST'])
 def add_supply_chain_stage(id):
@@ -529,53 +1151,338 @@ def add_supply_chain_stage(id):
 @app.route('/api/transactions', methods=['GET'])
 def get_transactions():
     user_id = get_current_user_id()
-    transactions = Transaction.query.filter(or_(Transaction.from_user_id == user_id, Transaction.to_user_id == user_id)).all()
-    return jsonify([t.to_dict() for t in transactions])
+    return list_response(Transaction, or_(Transaction.from_user_id == user_id, Transaction.to_user_id == user_id))
 
 @app.route('/api/products/<id>/transactions', methods=['GET'])
 def get_product_transactions(id):
-    transactions = Transaction.query.filter_by(product_id=id).all()
-    return jsonify([t.to_dict() for t in transactions])
+    return list_response(Transaction, Transaction.product_id == id)
+
+from blockchain import Blockchain, BlockAssemblyPolicy
+from chain_store import BlockStore
+from pow_engine import ProofOfWorkEngine
+from mining import ChainFollower, MiningQueue, QueueFullError
+
+app.config.setdefault('MINING_WORKERS', int(os.environ.get('MINING_WORKERS', 1)))
+app.config.setdefault('MINING_QUEUE_SIZE', int(os.environ.get('MINING_QUEUE_SIZE', 1000)))
+app.config.setdefault('BLOCK_MAX_TRANSACTIONS', int(os.environ.get('BLOCK_MAX_TRANSACTIONS', 100)))
+app.config.setdefault('BLOCK_MAX_WAIT_MS', int(os.environ.get('BLOCK_MAX_WAIT_MS', 2000)))
+app.config.setdefault('CHAIN_STORE_DIR', os.environ.get('CHAIN_STORE_DIR', os.path.join(app.instance_path, 'chain')))
+app.config.setdefault('CHAIN_FSYNC_EVERY', int(os.environ.get('CHAIN_FSYNC_EVERY', 32)))
+app.config.setdefault('POW_DIFFICULTY', int(os.environ.get('POW_DIFFICULTY', 16)))
+app.config.setdefault('POW_WORKERS', int(os.environ.get('POW_WORKERS', 1)))
+
+blockchain = Blockchain(
+    policy=BlockAssemblyPolicy(
+        max_transactions=app.config['BLOCK_MAX_TRANSACTIONS'],
+        max_wait_ms=app.config['BLOCK_MAX_WAIT_MS']
+    ),
+    store=BlockStore(app.config['CHAIN_STORE_DIR'], fsync_every=app.config['CHAIN_FSYNC_EVERY'],
+                     readonly=app.config['CHAIN_ROLE'] == 'reader'),
+    engine=ProofOfWorkEngine(difficulty=app.config['POW_DIFFICULTY'], workers=app.config['POW_WORKERS']),
+    genesis=False
+)
+
+def record_mined_transactions(transaction_ids, block, block_hash):
+    # Runs on a miner thread, so it needs its own app context and session
+    with app.app_context():
+        # Bulk updates skip the flush hooks, so tag the affected products by hand
+        mark_products_changed(db.session, [row[0] for row in db.session.query(Transaction.product_id)
+                                           .filter(Transaction.id.in_(transaction_ids)).distinct()])
+        Transaction.query.filter(Transaction.id.in_(transaction_ids)).update({
+            'blockchain_hash': block_hash,
+            'status': 'verified', # Auto verify with blockchain
+            'updated_at': int(time.time())
+        }, synchronize_session=False)
+        db.session.commit()
+        publish_transaction_updates(transaction_ids, block=block_event(block, block_hash))
+
+def block_event(block, block_hash):
+    return {
+        'index': block['index'], 'hash': block_hash, 'timestamp': block['timestamp'],
+        'proof': block['proof'], 'previousHash': block['previous_hash'],
+        'transactionCount': len(block['transactions'])
+    }
 
-from blockchain import Blockchain
+def record_failed_transactions(transaction_ids, error):
+    with app.app_context():
+        mark_products_changed(db.session, [row[0] for row in db.session.query(Transaction.product_id)
+                                           .filter(Transaction.id.in_(transaction_ids)).distinct()])
+        # Failed transactions stop counting towards revenue
+        delta = analytics.StatsDelta()
+        for from_user_id, created_at, price, quantity in db.session.query(
+                Transaction.from_user_id, Transaction.created_at, Transaction.price, Transaction.quantity
+        ).filter(Transaction.id.in_(transaction_ids), Transaction.status != 'failed'):
+            delta.add(from_user_id, created_at, revenue=-analytics.revenue_of(price, quantity))
+        delta.apply(db.session.connection(), StatsDaily.__table__)
+        Transaction.query.filter(Transaction.id.in_(transaction_ids)).update({
+            'status': 'failed',
+            'updated_at': int(time.time())
+        }, synchronize_session=False)
+        db.session.commit()
+        publish_transaction_updates(transaction_ids)
+
+def publish_transaction_updates(transaction_ids, block=None):
+    # Bulk updates skip the flush hooks, so subscribers are told about the new status here
+    transactions = select_dicts(Transaction.query.filter(Transaction.id.in_(transaction_ids)), Transaction)
+    for t in transactions:
+        broker.publish('transaction', t, (t['productId'],))
+    if block is not None:
+        product_ids = sorted({t['productId'] for t in transactions})
+        broker.publish('block', dict(block, productIds=product_ids), product_ids)
+
+miner = MiningQueue(
+    blockchain, record_mined_transactions, record_failed_transactions,
+    workers=app.config['MINING_WORKERS'], maxsize=app.config['MINING_QUEUE_SIZE']
+)
+
+def follow_owner_blocks(blocks):
+    # Reader workers: blocks mined by the chain owner. Wait until the owner has committed the
+    # verified status, then drop this worker's cached lookups and tell its subscribers.
+    with app.app_context():
+        mined = [[tx['transaction_id'] for tx in block['transactions'] if 'transaction_id' in tx] for block in blocks]
+        transaction_ids = [tid for ids in mined for tid in ids]
+        if transaction_ids and db.session.query(Transaction.id).filter(
+                Transaction.id.in_(transaction_ids), Transaction.status == 'pending').first() is not None:
+            return False
+        lookup_cache.invalidate(*{f"product:{tx['product_id']}" for block in blocks for tx in block['transactions']})
+        for block, ids in zip(blocks, mined):
+            publish_transaction_updates(ids, block=block_event(block, blockchain.block_hash(block['index'] - 1)))
+
+follower = ChainFollower(blockchain, follow_owner_blocks, interval=app.config['CHAIN_POLL_INTERVAL'])
+
+@app.before_request
+def start_chain_follower():
+    # Started by the first request, so it runs in each server worker rather than the master
+    if app.config['CHAIN_ROLE'] == 'reader':
+        follower.start()
+
+# Opt-in (PROFILING=1): route latency, SQL per request, spans around QR rendering, PoW
+# and hashing, exposed on /metrics
+profiler = Profiler()
+with app.app_context():
+    profiler.init_app(app, db.engine)
+if profiler.enabled:
+    qr_service.renderers = {fmt: profiler.timed(f'qr_render_{fmt}', fn) for fmt, fn in QRCodeService.renderers.items()}
+profiler.instrument(qr_service, 'generate_qr_pngs', 'qr_render_batch')
+profiler.instrument(blockchain, 'proof_of_work', 'proof_of_work')
+profiler.instrument(blockchain, 'hash', 'block_hash')
+profiler.instrument(app.json, 'response', 'json_response')
+
+def mining_payload(t):
+    return {
+        'sender': t.from_user_id,
+        'receiver': t.to_user_id,
+        'amount': t.quantity,
+        'product_id': t.product_id,
+        'type': t.transaction_type
+    }
 
-blockchain = Blockchain()
+def queue_for_mining(t):
+    # Readers leave the transaction pending; the chain owner picks it up from the database
+    if app.config['CHAIN_ROLE'] != 'reader':
+        miner.submit(t.id, mining_payload(t))
+
+def record_chained_transactions():
+    # Pending rows whose transaction is already in a block: the process stopped between
+    # appending the block and committing the verified status. Record them instead of
+    # mining them again. Blocks are scanned back from the tip to the oldest pending row.
+    pending = dict(db.session.query(Transaction.id, Transaction.created_at).filter(Transaction.status == 'pending'))
+    if not pending:
+        return 0
+    oldest = min(pending.values())
+    recorded = 0
+    for position in range(len(blockchain.chain) - 1, -1, -1):
+        block = blockchain.chain[position]
+        if block['timestamp'] < oldest - 1:
+            break
+        ids = [tx['transaction_id'] for tx in block['transactions'] if tx.get('transaction_id') in pending]
+        if ids:
+            record_mined_transactions(ids, block, blockchain.block_hash(position))
+            recorded += len(ids)
+    return recorded
+
+def requeue_pending_transactions(limit=None):
+    # Pending transactions this process is not already mining: left over from a restart, or
+    # committed by reader workers. Oldest first, at most `limit` of them.
+    submitted = 0
+    tracked = miner.tracked()
+    for t in Transaction.query.filter_by(status='pending').order_by(Transaction.created_at):
+        if limit is not None and submitted >= limit:
+            break
+        if t.id in tracked:
+            continue
+        miner.submit(t.id, mining_payload(t))
+        submitted += 1
+    return submitted
 
 # ... existing routes ...
 
 @app.route('/api/lookup/<identifier>', methods=['GET'])
 def lookup_product(identifier):
-    # Try batch number first
-    product = Product.query.filter_by(batch_number=identifier).first()
-    if not product:
-        product = Product.query.get(identifier)
-    
-    if not product:
-        return jsonify({'message': 'Product not found'}), 404
-
-    # Get related data
-    stages = SupplyChainStage.query.filter_by(product_id=product.id).all()
-    verifications = Verification.query.filter_by(product_id=product.id).all()
-    transactions = Transaction.query.filter_by(product_id=product.id).all()
-    farmer = User.query.get(product.created_by)
-    farmer_name = f"{farmer.first_name} {farmer.last_name}" if farmer else "Unknown"
-    
-    qr_data = qr_service.generate_qr_data(product, farmer_name)
-    
-    return jsonify({
-        'product': product.to_dict(),
-        'farmer': farmer.to_dict() if farmer else None,
-        'supplyChain': [s.to_dict() for s in stages],
-        'verifications': [v.to_dict() for v in verifications],
-        'transactions': [t.to_dict() for t in transactions],
-        'qrData': qr_data
-    })
+    doc = lookup_cache.get(identifier)
+    if doc is None:
+        # Batch number wins over id, as before. The farmer and the (few) verifications come
+        # back joined to the product; transactions, which can run to thousands, are one
+        # column query rather than a second join, which would multiply the rows.
+        product = Product.query.options(
+            joinedload(Product.farmer),
+            joinedload(Product.verifications)
+        ).filter(or_(Product.batch_number == identifier, Product.id == identifier)) \
+         .order_by(case((Product.batch_number == identifier, 0), else_=1)).first()
+
+        if not product:
+            return jsonify({'message': 'Product not found'}), 404
+
+        farmer = product.farmer
+        farmer_name = f"{farmer.first_name} {farmer.last_name}" if farmer else "Unknown"
+        doc = {
+            'product': product.to_dict(),
+            'farmer': farmer.to_dict() if farmer else None,
+            'supplyChain': timelines.view(product.id),
+            'verifications': [v.to_dict() for v in product.verifications],
+            'transactions': select_dicts(Transaction.query.filter_by(product_id=product.id), Transaction),
+            'qrData': qr_service.generate_qr_data(product, farmer_name)
+        }
+        lookup_cache.set(identifier, doc, tags=(f'product:{product.id}', f'user:{product.created_by}'))
+
+    # qrData carries a per-request timestamp
+    return jsonify(dict(doc, qrData=dict(doc['qrData'], timestamp=int(time.time() * 1000))))
+
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify({'lookup': lookup_cache.stats(), 'qr': qr_service.cache.stats(), 'timeline': timelines.stats(),
+                    'users': users.stats(), 'events': broker.stats()})
+
+@app.route('/api/products/<id>/proof', methods=['GET'])
+def get_product_proof(id):
+    product = Product.query.get(id)
+    if not product: return jsonify({'message': 'Product not found'}), 404
+    transactions = Transaction.query.filter(
+        Transaction.product_id == product.id, Transaction.blockchain_hash.isnot(None)
+    ).all()
+    proofs = []
+    for t in transactions:
+        block = blockchain.get_block_by_hash(t.blockchain_hash)
+        if not block:
+            continue
+        for proof in blockchain.transaction_proof(block, transaction_id=t.id):
+            proof.update({'transactionId': t.id, 'blockHash': t.blockchain_hash, 'blockIndex': block['index']})
+            proofs.append(proof)
+    return jsonify({'productId': product.id, 'batchNumber': product.batch_number, 'proofs': proofs})
+
+app.config.setdefault('BLOCKCHAIN_PAGE_SIZE', 100)
+app.config.setdefault('BLOCKCHAIN_PAGE_MAX', 500)
+
+def block_with_hash(block):
+    # Blocks are immutable once mined, so their hash doubles as an ETag
+    return dict(block, hash=blockchain.block_hash(block['index'] - 1))
 
 @app.route('/api/blockchain', methods=['GET'])
 def get_blockchain():
-    return jsonify({
-        'chain': blockchain.chain,
-        'length': len(blockchain.chain)
+    # Cursor is a block index: asc returns blocks after it, desc returns blocks before it
+    length = len(blockchain.chain)
+    limit = min(max(request.args.get('limit', app.config['BLOCKCHAIN_PAGE_SIZE'], type=int), 1),
+                app.config['BLOCKCHAIN_PAGE_MAX'])
+    order = request.args.get('order', 'asc')
+    if order == 'desc':
+        cursor = min(request.args.get('cursor', length + 1, type=int), length + 1)
+        start = max(cursor - 1 - limit, 0)
+        page = blockchain.chain[start:cursor - 1][::-1]
+        has_more = start > 0
+    else:
+        cursor = max(request.args.get('cursor', 0, type=int), 0)
+        page = blockchain.chain[cursor:cursor + limit]
+        has_more = cursor + limit < length
+    blocks = [block_with_hash(b) for b in page]
+
+    response = jsonify({
+        'chain': blocks,
+        'length': length,
+        'limit': limit,
+        'order': order,
+        'nextCursor': blocks[-1]['index'] if blocks and has_more else None
+    })
+    response.set_etag(hashlib.sha256(
+        ''.join(b['hash'] for b in blocks).encode() + f'|{length}|{has_more}'.encode()
+    ).hexdigest())
+    return response.make_conditional(request)
+
+@app.route('/api/blockchain/blocks/<int:index>', methods=['GET'])
+def get_block(index):
+    if not 1 <= index <= len(blockchain.chain):
+        return jsonify({'message': 'Block not found'}), 404
+    block = block_with_hash(blockchain.chain[index - 1])
+    response = jsonify(block)
+    response.set_etag(block['hash'])
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
+@app.route('/api/blockchain/export', methods=['GET'])
+def export_blockchain():
+    # NDJSON stream, one block per line, so a full export never sits in memory at once
+    length = len(blockchain.chain)
+
+    def generate():
+        for position in range(length):
+            yield json.dumps(block_with_hash(blockchain.chain[position])) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson', headers={
+        'Content-Disposition': 'attachment; filename=agrotrace-chain.ndjson',
+        'X-Chain-Length': str(length)
+    })
+
+app.config.setdefault('VERIFY_MAX_WORKERS', int(os.environ.get('VERIFY_MAX_WORKERS', os.cpu_count() or 1)))
+
+@app.route('/api/blockchain/verify', methods=['GET'])
+def verify_blockchain():
+    full = request.args.get('mode') == 'full'
+    workers = None
+    if full:
+        # A full audit rehashes the whole chain in a fresh process pool: admins only
+        denied = users.check('admin')
+        if denied:
+            return denied
+        workers = request.args.get('workers', app.config['VERIFY_MAX_WORKERS'], type=int)
+        if 'workers' in request.args and request.args.get('workers', type=int) is None:
+            return jsonify({'message': 'workers must be an integer'}), 400
+        workers = min(max(workers, 1), app.config['VERIFY_MAX_WORKERS'])
+    return jsonify(blockchain.verify(full=full, workers=workers))
+
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """Server-sent events: new stages, transaction status changes and mined blocks.
+
+    ?types=stage,transaction,block narrows the event types and ?product=<id> (repeatable,
+    or comma separated) limits stage/transaction/block events to those products.
+    Reconnecting browsers send Last-Event-ID and receive what they missed.
+    """
+    types = [t for t in request.args.get('types', ','.join(events.EVENT_TYPES)).split(',') if t]
+    unknown = [t for t in types if t not in events.EVENT_TYPES]
+    if unknown:
+        return jsonify({'message': f"Unknown event types: {', '.join(unknown)}"}), 400
+    product_ids = [p for arg in request.args.getlist('product') for p in arg.split(',') if p]
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('lastEventId'))
+    sub = broker.subscribe(types, product_ids, last_event_id)
+    if sub is None:
+        response = jsonify({'message': 'Too many event subscribers, retry later'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    heartbeat = app.config['EVENTS_HEARTBEAT']
+
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                frames = sub.wait(heartbeat)
+                # A comment line keeps proxies from timing the connection out
+                yield ''.join(frames) if frames else ': keepalive\n\n'
+        finally:
+            broker.unsubscribe(sub)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'
     })
 
 @app.route('/blockchain')
@@ -590,7 +1497,7 @@ def verify_page_direct():
 def track_page_direct():
     return render_template('index.html')
 
-# Update Transaction Creation to Mine Block
+# Transactions are committed as pending and mined in the background
 @app.route('/api/transactions', methods=['POST'])
 def create_transaction():
     data = request.json
@@ -601,36 +1508,187 @@ def create_transaction():
     )
     db.session.add(t)
     db.session.commit()
-    
-    # Mining
-    sender = t.from_user_id
-    receiver = t.to_user_id
-    amount = t.quantity
-    blockchain.add_transaction(sender, receiver, amount, t.product_id, t.transaction_type)
-    last_block = blockchain.get_last_block()
-    previous_hash = blockchain.hash(last_block)
-    proof = blockchain.proof_of_work(last_block['proof'])
-    block = blockchain.create_block(proof, previous_hash)
-    
-    t.blockchain_hash = blockchain.hash(block)
-    t.status = 'verified' # Auto verify with blockchain
-    db.session.commit()
-    
-    return jsonify(t.to_dict()), 201
+
+    try:
+        queue_for_mining(t)
+    except QueueFullError:
+        t.status = 'failed'
+        db.session.commit()
+        response = jsonify({'message': 'Mining queue is full, retry later', 'transaction': t.to_dict()})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+
+    response = jsonify({
+        'ticket': t.id,
+        'statusUrl': url_for('get_transaction_status', id=t.id),
+        'transaction': t.to_dict()
+    })
+    response.headers['Location'] = url_for('get_transaction_status', id=t.id)
+    return response, 202
+
+@app.route('/api/transactions/<id>/status', methods=['GET'])
+def get_transaction_status(id):
+    t = Transaction.query.get(id)
+    if not t: return jsonify({'message': 'Transaction not found'}), 404
+    ticket = miner.ticket_status(id) or {}
+    return jsonify({
+        'ticket': t.id,
+        'status': t.status,
+        'miningStatus': ticket.get('status', t.status),
+        'blockchainHash': t.blockchain_hash,
+        'blockIndex': ticket.get('blockIndex'),
+        'error': ticket.get('error')
+    })
+
+@app.route('/api/mining/stats', methods=['GET'])
+def get_mining_stats():
+    return jsonify(miner.stats())
 
 # Analytics
 @app.route('/api/analytics/stats', methods=['GET'])
 def get_stats():
+    totals, _ = analytics.read(db.session.connection(), StatsDaily.__table__)
     return jsonify({
-        'totalProducts': Product.query.count(),
-        'totalTransactions': Transaction.query.count(),
-        'activeShipments': SupplyChainStage.query.count(),
-        'revenue': 125000,
+        'totalProducts': totals['products'],
+        'totalTransactions': totals['transactions'],
+        'activeShipments': totals['active_shipments'],
+        'revenue': round(totals['revenue'], 2),
+        'totalYield': round(totals['yield_total'], 2),
         'blocksMined': len(blockchain.chain)
     })
 
-if __name__ == '__main__':
+app.config.setdefault('TIMESERIES_MAX_HOURS', 31 * 24)
+app.config.setdefault('TIMESERIES_MAX_DAYS', 3660)
+
+@app.route('/api/analytics/timeseries', methods=['GET'])
+def get_timeseries():
+    """Event counts and sums per bucket, by product type, read from the rollup tables.
+
+    ?event=transaction|product_created|stage, ?interval=day|hour, ?days=90 (or ?from=&to= in
+    epoch seconds), ?productType= to pick one series. Empty buckets are omitted.
+    """
+    event = request.args.get('event', 'transaction')
+    interval = request.args.get('interval', 'day')
+    if event not in analytics.EVENTS or interval not in analytics.ROLLUP_INTERVALS:
+        return jsonify({'message': f"event must be one of {', '.join(analytics.EVENTS)}; interval must be day or hour"}), 400
+    width = analytics.ROLLUP_INTERVALS[interval]
+    end = request.args.get('to', int(time.time()), type=int)
+    start = request.args.get('from', end - request.args.get('days', 90, type=int) * 86400, type=int)
+    max_span = app.config['TIMESERIES_MAX_HOURS'] * 3600 if interval == 'hour' else app.config['TIMESERIES_MAX_DAYS'] * 86400
+    if end - start > max_span:
+        return jsonify({'message': f'Range too large for interval {interval}'}), 400
+    start, end = (start // width) * width, (end // width + 1) * width
+    series = analytics.timeseries(db.session.connection(), ROLLUP_TABLES[interval], event, start, end,
+                                  request.args.get('productType'))
+    return jsonify({'event': event, 'interval': interval, 'from': start, 'to': end, 'series': series})
+
+@app.cli.command('rollup-backfill')
+@click.option('--chunk-days', default=30, show_default=True, help='Days of history per transaction.')
+def rollup_backfill_command(chunk_days):
+    """Recompute the hourly and daily rollups from history."""
+    windows = analytics.backfill_rollups(
+        db.engine, chunk_days,
+        progress=lambda start, end: print(f"Rolled up {time.strftime('%Y-%m-%d', time.gmtime(start))} .. {time.strftime('%Y-%m-%d', time.gmtime(end))}")
+    )
+    print(f"Backfilled {windows} window(s)")
+
+# Schema
+def hot_path_queries():
+    # The filters the API runs on every request; each must be served by an index
+    some_id = 'x'
+    return {
+        'products_by_farmer': select(Product).where(Product.created_by == some_id)
+            .order_by(Product.created_at.desc(), Product.id.desc()),
+        'products_by_status': select(Product).where(Product.status == 'created')
+            .order_by(Product.created_at.desc(), Product.id.desc()),
+        'products_by_type': select(Product).where(Product.product_type == 'Grain')
+            .order_by(Product.created_at.desc(), Product.id.desc()),
+        'products_page': select(Product).where(tuple_(Product.created_at, Product.id) < (0, some_id))
+            .order_by(Product.created_at.desc(), Product.id.desc()).limit(100),
+        'recent_products': select(Product).order_by(Product.created_at.desc()).limit(10),
+        'product_by_batch': select(Product).where(Product.batch_number == some_id),
+        'stages_by_product': select(SupplyChainStage).where(SupplyChainStage.product_id == some_id),
+        'transactions_by_product': select(Transaction).where(Transaction.product_id == some_id)
+            .order_by(Transaction.created_at.desc(), Transaction.id.desc()),
+        'transactions_by_user': select(Transaction).where(or_(Transaction.from_user_id == some_id, Transaction.to_user_id == some_id)),
+        'pending_transactions': select(Transaction).where(Transaction.status == 'pending'),
+        'verifications_by_product': select(Verification).where(Verification.product_id == some_id),
+        'timeseries_daily': select(RollupDaily).where(RollupDaily.event == 'transaction', RollupDaily.bucket >= 0)
+            .order_by(RollupDaily.bucket),
+    }
+
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Create missing tables and apply pending migrations."""
+    db.create_all()
+    for migration_id in migrations.upgrade(db.engine):
+        print(f"Applied migration: {migration_id}")
+
+@app.cli.command('stats-rebuild')
+def stats_rebuild_command():
+    """Recompute the dashboard counters from the base tables."""
+    with db.engine.begin() as conn:
+        analytics.rebuild(conn)
+    print("Rebuilt stats_daily")
+
+@app.cli.command('db-explain')
+def db_explain_command():
+    """Fail if any hot-path query falls back to a full table scan."""
+    findings = migrations.full_scans(db.engine, hot_path_queries())
+    for name, plan in findings.items():
+        print(f"{name}: full scan -> {' | '.join(plan)}")
+    if findings:
+        raise SystemExit(1)
+    print(f"All {len(hot_path_queries())} hot-path queries use an index")
+
+# Deployment
+@app.cli.command('db-init')
+def db_init_command():
+    """Create tables, apply migrations and seed the demo data (once, before the workers start)."""
+    db.create_all()
+    for migration_id in migrations.upgrade(db.engine):
+        print(f"Applied migration: {migration_id}")
+    seed_db()
+
+@app.cli.command('chain-owner')
+def chain_owner_command():
+    """Own the chain: mine the transactions the web workers leave pending."""
+    if app.config['CHAIN_ROLE'] == 'reader':
+        raise click.ClickException('chain-owner cannot run with CHAIN_ROLE=reader')
+    try:
+        blockchain.store.acquire()
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    blockchain.ensure_genesis()
+    print(f"Owning {app.config['CHAIN_STORE_DIR']} ({len(blockchain.chain)} blocks)")
     with app.app_context():
-        db.create_all()
-        seed_db()
-    app.run(debug=True, port=5000, host="0.0.0.0")
+        recorded = record_chained_transactions()
+    if recorded:
+        print(f"Recorded {recorded} transaction(s) already on chain")
+    while True:
+        miner.retry_unrecorded()
+        with app.app_context():
+            free = miner.queue.maxsize - miner.queue.qsize() if miner.queue.maxsize else None
+            try:
+                submitted = requeue_pending_transactions(limit=free)
+            except QueueFullError:
+                submitted = 0
+            db.session.remove()
+        if not submitted:
+            time.sleep(app.config['CHAIN_POLL_INTERVAL'])
+
+if __name__ == '__main__':
+    # Development server: one process that initialises the database and mines in-process.
+    # For production see wsgi.py and gunicorn.conf.py.
+    debug = os.environ.get('FLASK_DEBUG', '0') == '1'
+    # With FLASK_DEBUG=1 this module also runs in the reloader's watcher process, which never
+    # serves; only the serving process may write the chain (its first block takes the lock)
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        with app.app_context():
+            db.create_all()
+            migrations.upgrade(db.engine)
+            seed_db()
+            blockchain.ensure_genesis()
+            record_chained_transactions()
+            requeue_pending_transactions()
+    app.run(debug=debug, port=5000, host="0.0.0.0")
@@ -0,0 +1,12 @@
+# ASGI entry point for uvicorn/hypercorn: uvicorn asgi:app --workers 4
+#
+# The app stays a WSGI app; requests run on the adapter's thread pool. Run the web workers
+# with CHAIN_ROLE=reader next to a single chain owner, as with gunicorn.
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:
+    raise RuntimeError('asgi.py needs the asgiref package (pip install asgiref)')
+
+from app import app as wsgi_app
+
+app = WsgiToAsgi(wsgi_app)
@@ -0,0 +1,71 @@
+import functools
+
+from flask import g, jsonify, session
+
+from response_cache import TaggedCache
+
+# Who is making the request, resolved once per request and kept on flask.g. User records
+# come from a short TTL cache in front of the database, so role checks and farmer-name
+# lookups no longer cost a query each. Records are the API dicts from User.to_dict();
+# entries are tagged 'user:<id>' and dropped when that user is written.
+
+
+class UserResolver:
+    def __init__(self, loader, ttl=30, max_entries=4096):
+        """`loader(user_id)` returns the user's API dict, or None if there is no such user."""
+        self.loader = loader
+        self.cache = TaggedCache(max_entries=max_entries, ttl=ttl)
+
+    def get(self, user_id):
+        if not user_id:
+            return None
+        user = self.cache.get(user_id)
+        if user is None:
+            # Unknown ids are not cached, so a user created a moment later is found
+            user = self.loader(user_id)
+            if user is not None:
+                self.cache.set(user_id, user, tags=(f'user:{user_id}',))
+        return user
+
+    def current(self):
+        """The logged-in user for this request (or None), looked up at most once."""
+        if '_current_user' not in g:
+            g._current_user = self.get(session.get('user_id'))
+        return g._current_user
+
+    def role(self):
+        user = self.current()
+        return user['role'] if user else None
+
+    def invalidate(self, *tags):
+        self.cache.invalidate(*tags)
+
+    def check(self, *roles):
+        """None if the current user may proceed, else the (response, status) to return.
+
+        Without `roles` any logged-in user may; 401 without one, 403 for other roles.
+        """
+        user = self.current()
+        if user is None:
+            return jsonify({'message': 'Unauthorized'}), 401
+        if roles and user['role'] not in roles:
+            return jsonify({'message': 'Unauthorized'}), 403
+        return None
+
+    def login_required(self, view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            return self.check() or view(*args, **kwargs)
+        return wrapper
+
+    def roles_required(self, *roles):
+        """401 without a logged-in user, 403 when their role is not one of `roles`."""
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                return self.check(*roles) or view(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def stats(self):
+        return self.cache.stats()
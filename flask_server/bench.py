@@ -0,0 +1,369 @@
+import argparse
+import contextlib
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+# Reproducible benchmark and load-test run. Seeds a scratch database at the requested scale
+# (seed_db users plus farmers, products and stages modelled on sql/add_products.sql), times
+# the blockchain and QR hot paths in-process, then drives the main endpoints over real HTTP
+# from a thread pool. Everything is written as one JSON document so runs can be diffed:
+#
+#   python flask_server/bench.py --products 20000 --output before.json
+#   python flask_server/bench.py --products 20000 --baseline before.json --output after.json
+
+# Farmers, product lines and stage templates from sql/add_products.sql
+FARMERS = [
+    ('John', 'Smith', 'Green Valley Farm', 'Iowa, USA'),
+    ('Mary', 'Green', 'Organic Harvest Co.', 'California, USA'),
+    ('David', 'Field', 'Field Fresh Farms', 'Texas, USA'),
+]
+PRODUCTS = [
+    ('Premium Organic Wheat', 'High-quality organic wheat grown without pesticides', 'Grain', 'WHEAT', 1500.00, 365),
+    ('Red Delicious Apples', 'Crispy and sweet red delicious apples', 'Fruit', 'APPLE', 800.50, 31),
+    ('Vine-Ripened Tomatoes', 'Fresh organic tomatoes ripened on the vine', 'Vegetable', 'TOMATO', 600.75, 21),
+    ('Sweet Corn', 'Non-GMO sweet corn perfect for fresh consumption', 'Vegetable', 'CORN', 1200.00, 31),
+    ('Organic Soybeans', 'Premium organic soybeans for processing', 'Legume', 'SOY', 2000.25, 365),
+]
+STATUSES = ['created', 'in_production', 'quality_check', 'in_transit', 'delivered']
+STAGES = [
+    ('Farm Production', 'production', 'completed'),
+    ('Quality Inspection', 'inspection', 'completed'),
+    ('Packaging', 'transport', 'completed'),
+    ('Distribution', 'transport', 'in_transit'),
+]
+SEARCH_TERMS = ['wheat', 'Apple', 'tomato', 'CORN-2024', 'Organic', 'Iowa', 'soy']
+
+
+def configure_environment(args, workdir):
+    # The app reads these at import time
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['CHAIN_STORE_DIR'] = os.path.join(workdir, 'chain')
+    os.environ['POW_DIFFICULTY'] = str(args.pow_difficulty)
+    os.environ.setdefault('MINING_QUEUE_SIZE', str(args.mining_queue_size))
+
+
+def timed(fn, seconds, min_runs=3, max_runs=100000):
+    """Call fn repeatedly for about `seconds`; returns throughput and latency percentiles."""
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while len(latencies) < max_runs and (len(latencies) < min_runs or time.perf_counter() < deadline):
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+    return summarise(latencies, sum(latencies))
+
+
+def summarise(latencies, elapsed):
+    if not latencies:
+        return {'runs': 0}
+    latencies = sorted(latencies)
+    pick = lambda q: round(latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000, 3)
+    return {
+        'runs': len(latencies),
+        'opsPerSec': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'meanMs': round(statistics.fmean(latencies) * 1000, 3),
+        'p50Ms': pick(0.5),
+        'p95Ms': pick(0.95),
+        'p99Ms': pick(0.99),
+    }
+
+
+def seed(app_module, args, rng):
+    """Fill the scratch database; returns the batch numbers and farmer ids that were created."""
+    app, db = app_module.app, app_module.db
+    now = int(time.time())
+    started = time.perf_counter()
+    with app.app_context():
+        # seed_db reports on stdout, which is reserved for the results document
+        with contextlib.redirect_stdout(sys.stderr):
+            db.create_all()
+            app_module.migrations.upgrade(db.engine)
+            app_module.seed_db()
+
+        farmers = []
+        for i in range(args.farmers):
+            first, last, company, location = FARMERS[i % len(FARMERS)]
+            farmers.append({
+                'id': f'farmer-{i + 1:05d}', 'email': f'farmer{i + 1}@bench.example', 'first_name': first,
+                'last_name': last, 'role': 'farmer', 'company_name': company, 'location': location,
+                'verification_status': 'verified', 'created_at': now, 'updated_at': now
+            })
+        db.session.execute(app_module.User.__table__.insert(), farmers)
+        buyers = ['00000000000000000000000000000004', '00000000000000000000000000000005']
+
+        batches = []
+        for start in range(0, args.products, 5000):
+            products, stages, transactions = [], [], []
+            for i in range(start, min(start + 5000, args.products)):
+                name, description, product_type, prefix, quantity, shelf_days = PRODUCTS[i % len(PRODUCTS)]
+                farmer = rng.choice(farmers)
+                created_at = now - rng.randrange(args.days * 86400)
+                product_id = f'product-{i + 1:08d}'
+                batch = f'{prefix}-{time.gmtime(created_at).tm_year}-{i + 1:07d}'
+                batches.append(batch)
+                products.append({
+                    'id': product_id, 'name': name, 'description': description, 'product_type': product_type,
+                    'batch_number': batch, 'quantity': round(quantity * rng.uniform(0.5, 1.5), 2), 'unit': 'kg',
+                    'origin_farm_id': farmer['id'], 'harvest_date': created_at - 86400,
+                    'expiry_date': created_at + shelf_days * 86400, 'status': rng.choice(STATUSES),
+                    'qr_code': None, 'created_by': farmer['id'], 'created_at': created_at, 'updated_at': created_at
+                })
+                for s, (stage_name, stage_type, status) in enumerate(STAGES[:args.stages_per_product]):
+                    stages.append({
+                        'id': f'stage-{i + 1:08d}-{s}', 'product_id': product_id, 'stage_name': stage_name,
+                        'stage_type': stage_type, 'handler_id': farmer['id'], 'location': farmer['location'],
+                        'timestamp': created_at + s * 3600, 'notes': None, 'verification_data': None, 'status': status
+                    })
+                for t in range(args.transactions_per_product):
+                    transactions.append({
+                        'id': f'tx-{i + 1:08d}-{t}', 'product_id': product_id, 'from_user_id': farmer['id'],
+                        'to_user_id': rng.choice(buyers), 'transaction_type': 'sale',
+                        'quantity': round(rng.uniform(10, 100), 2), 'price': round(rng.uniform(1, 5), 2),
+                        'currency': 'USD', 'status': 'verified', 'blockchain_hash': None,
+                        'verification_signature': None, 'tx_metadata': None,
+                        'created_at': created_at + 7200 + t, 'updated_at': created_at + 7200 + t
+                    })
+            with app_module.search.bulk_index(db.session.connection(), app_module.product_search_uses_fts()):
+                db.session.execute(app_module.Product.__table__.insert(), products)
+            db.session.execute(app_module.SupplyChainStage.__table__.insert(), stages)
+            if transactions:
+                db.session.execute(app_module.Transaction.__table__.insert(), transactions)
+            db.session.commit()
+
+        # Core inserts bypass the counter hooks; rebuild the derived tables once at the end
+        with db.engine.begin() as conn:
+            app_module.analytics.rebuild(conn)
+        app_module.analytics.backfill_rollups(db.engine, chunk_days=90)
+    return {
+        'elapsedSec': round(time.perf_counter() - started, 2),
+        'users': args.farmers + 6,
+        'products': args.products,
+        'stages': args.products * min(args.stages_per_product, len(STAGES)),
+        'transactions': args.products * args.transactions_per_product,
+    }, batches
+
+
+def micro(app_module, args):
+    from blockchain import Blockchain
+    from pow_engine import ProofOfWorkEngine
+
+    seconds = args.micro_seconds
+    results = {}
+
+    chain = Blockchain(engine=ProofOfWorkEngine(difficulty=args.chain_difficulty))
+    for i in range(args.chain_length):
+        chain.add_transaction('a', 'b', i, f'product-{i}', 'sale', transaction_id=f'tx-{i}')
+        chain.mine_pending_block()
+    block = chain.chain[-1]
+    results['blockchain.hash'] = timed(lambda: chain.hash(block), seconds)
+    results['blockchain.is_chain_valid'] = dict(timed(lambda: chain.is_chain_valid(chain.chain), seconds),
+                                                blocks=len(chain.chain))
+    miner = Blockchain(engine=ProofOfWorkEngine(difficulty=args.pow_difficulty))
+    proofs = iter(range(10 ** 9))
+    results['blockchain.proof_of_work'] = dict(timed(lambda: miner.proof_of_work(next(proofs)), seconds),
+                                               difficulty=args.pow_difficulty)
+
+    service = app_module.QRCodeService(cache=app_module.QRRenderCache(max_entries=16))
+    data = {'productId': 'p1', 'batchNumber': 'WHEAT-2024-0000001', 'name': 'Premium Organic Wheat',
+            'farmer': 'John Smith', 'harvestDate': '2024-03-15T00:00:00', 'status': 'created',
+            'verificationUrl': 'http://localhost:5000/verify/WHEAT-2024-0000001',
+            'trackingUrl': 'http://localhost:5000/track/WHEAT-2024-0000001', 'timestamp': 0}
+    counter = iter(range(10 ** 9))
+    results['qr.render_uncached'] = timed(
+        lambda: service.qr_image(dict(data, batchNumber=f'WHEAT-{next(counter)}')), seconds)
+    service.qr_image(data)
+    results['qr.render_cached'] = timed(lambda: service.qr_image(data), seconds)
+    results['qr.data_uri_cached'] = timed(lambda: service.generate_qr_code(data), seconds)
+    return results
+
+
+class Client:
+    """One logged-in HTTP session against the benchmark server."""
+
+    def __init__(self, base_url, email):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        self.request('POST', '/api/auth/login', {'email': email})
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                     headers={'Content-Type': 'application/json'} if data else {})
+        try:
+            with self.opener.open(req, timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+
+def scenarios(batches, rng_seed):
+    rng = random.Random(rng_seed)
+    lock = threading.Lock()
+
+    def pick(seq):
+        with lock:
+            return rng.choice(seq)
+
+    hot = batches[:1000]
+    return {
+        'GET /api/lookup/<batch>': lambda c: c.request('GET', f'/api/lookup/{pick(hot)}'),
+        'GET /api/products': lambda c: c.request('GET', '/api/products?limit=100'),
+        'GET /api/search/products': lambda c: c.request('GET', f'/api/search/products?q={pick(SEARCH_TERMS)}'),
+        'POST /api/transactions': lambda c: c.request('POST', '/api/transactions', {
+            'productId': 'product-00000001', 'toUserId': '00000000000000000000000000000004',
+            'transactionType': 'sale', 'quantity': 1, 'price': 2.5
+        }),
+    }
+
+
+def load(app_module, args, batches):
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    results = {}
+    try:
+        for name, run in scenarios(batches, args.seed).items():
+            if args.only and not any(part in name for part in args.only):
+                continue
+            clients = [Client(base_url, 'farmer@example.com') for _ in range(args.concurrency)]
+            latencies, statuses, lock = [], {}, threading.Lock()
+            deadline = time.perf_counter() + args.load_seconds
+
+            def worker(client):
+                mine, codes = [], {}
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    status = run(client)
+                    mine.append(time.perf_counter() - started)
+                    codes[status] = codes.get(status, 0) + 1
+                with lock:
+                    latencies.extend(mine)
+                    for code, count in codes.items():
+                        statuses[code] = statuses.get(code, 0) + count
+
+            started = time.perf_counter()
+            threads = [threading.Thread(target=worker, args=(c,)) for c in clients]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - started
+            summary = summarise(latencies, elapsed)
+            summary['requestsPerSec'] = summary.pop('opsPerSec', None)
+            summary['statuses'] = {str(code): count for code, count in sorted(statuses.items())}
+            summary['concurrency'] = args.concurrency
+            results[name] = summary
+    finally:
+        server.shutdown()
+    return results
+
+
+def compare(current, baseline, path=''):
+    """Percent change for every throughput/latency figure present in both documents."""
+    changes = {}
+    for key, value in current.items():
+        other = baseline.get(key) if isinstance(baseline, dict) else None
+        name = f'{path}.{key}' if path else key
+        if isinstance(value, dict) and isinstance(other, dict):
+            changes.update(compare(value, other, name))
+        elif key in ('opsPerSec', 'requestsPerSec', 'p50Ms', 'p95Ms', 'p99Ms') and value is not None and other:
+            changes[name] = round((value - other) / other * 100, 1)
+    return changes
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def drain(miner, timeout):
+    # Accepted transactions wait up to BLOCK_MAX_WAIT_MS for their batch to seal, so the
+    # miner's counters are only complete once every queued job has been processed
+    started = time.perf_counter()
+    while miner.queue.unfinished_tasks and time.perf_counter() - started < timeout:
+        time.sleep(0.05)
+    stats = miner.stats()
+    stats['drained'] = not miner.queue.unfinished_tasks
+    stats['drainSeconds'] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Seed a scratch database and benchmark the API and blockchain')
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--farmers', type=int, default=50)
+    parser.add_argument('--stages-per-product', type=int, default=3)
+    parser.add_argument('--transactions-per-product', type=int, default=1)
+    parser.add_argument('--days', type=int, default=365, help='Spread creation times over this many days')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed; same seed, same dataset')
+    parser.add_argument('--chain-length', type=int, default=200)
+    parser.add_argument('--chain-difficulty', type=int, default=8)
+    parser.add_argument('--pow-difficulty', type=int, default=12)
+    parser.add_argument('--mining-queue-size', type=int, default=100000)
+    parser.add_argument('--micro-seconds', type=float, default=2.0)
+    parser.add_argument('--load-seconds', type=float, default=5.0)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--drain-seconds', type=float, default=60.0,
+                        help='Wait this long for queued transactions to be mined before reading miner stats')
+    parser.add_argument('--only', nargs='*', help='Only load-test endpoints whose name contains one of these')
+    parser.add_argument('--skip-micro', action='store_true')
+    parser.add_argument('--skip-load', action='store_true')
+    parser.add_argument('--workdir', help='Keep the scratch database here instead of a temporary directory')
+    parser.add_argument('--output', help='Write the JSON results to this file as well as stdout')
+    parser.add_argument('--baseline', help='A previous results file to compare against')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or tmp
+        os.makedirs(workdir, exist_ok=True)
+        configure_environment(args, workdir)
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import app as app_module
+
+        rng = random.Random(args.seed)
+        results = {
+            'meta': {
+                'startedAt': int(time.time()), 'revision': git_revision(), 'python': platform.python_version(),
+                'platform': platform.platform(), 'cpuCount': os.cpu_count(),
+                'args': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline', 'workdir')},
+            }
+        }
+        results['seed'], batches = seed(app_module, args, rng)
+        if not args.skip_micro:
+            results['micro'] = micro(app_module, args)
+        if not args.skip_load:
+            results['load'] = load(app_module, args, batches)
+            results['mining'] = drain(app_module.miner, args.drain_seconds)
+        app_module.blockchain.sync()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            results['changePercent'] = compare(results, json.load(f))
+    document = json.dumps(results, indent=2)
+    print(document)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(document + '\n')
+    return results
+
+
+if __name__ == '__main__':
+    main()
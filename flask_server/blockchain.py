@@ -1,12 +1,95 @@
 import hashlib
 import json
+import os
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pow_engine import DEFAULT_DIFFICULTY, ProofOfWorkEngine, valid_proof
+
+def merkle_leaf(transaction):
+    # Leaves and interior nodes get distinct prefixes so a node can never pass as a leaf
+    encoded = json.dumps(transaction, sort_keys=True).encode()
+    return hashlib.sha256(b'\x00' + encoded).hexdigest()
+
+def _merkle_node(left, right):
+    return hashlib.sha256(b'\x01' + bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+def _merkle_levels(leaves):
+    levels = [leaves]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        if len(level) % 2:
+            level = level + [level[-1]]
+        levels.append([_merkle_node(level[i], level[i + 1]) for i in range(0, len(level), 2)])
+    return levels
+
+def merkle_root(transactions):
+    if not transactions:
+        return hashlib.sha256(b'').hexdigest()
+    return _merkle_levels([merkle_leaf(tx) for tx in transactions])[-1][0]
+
+def merkle_proof(transactions, position):
+    """Sibling hashes from leaf `position` up to the root, each tagged with its side."""
+    path = []
+    for level in _merkle_levels([merkle_leaf(tx) for tx in transactions])[:-1]:
+        sibling = position ^ 1
+        path.append({
+            'hash': level[sibling] if sibling < len(level) else level[position],
+            'position': 'left' if sibling < position else 'right'
+        })
+        position //= 2
+    return path
+
+def verify_merkle_proof(leaf_hash, path, root):
+    node = leaf_hash
+    for step in path:
+        node = _merkle_node(step['hash'], node) if step['position'] == 'left' else _merkle_node(node, step['hash'])
+    return node == root
+
+class BlockAssemblyPolicy:
+    """Seal a block once max_transactions are pending or the oldest has waited max_wait_ms."""
+
+    def __init__(self, max_transactions=100, max_wait_ms=2000):
+        self.max_transactions = max(1, int(max_transactions))
+        self.max_wait_ms = max(0, int(max_wait_ms))
+
+    def time_remaining(self, oldest_pending_at, now=None):
+        now = time.time() if now is None else now
+        return max(0.0, oldest_pending_at + self.max_wait_ms / 1000.0 - now)
+
+    def should_seal(self, pending_count, oldest_pending_at, now=None):
+        if pending_count == 0:
+            return False
+        if pending_count >= self.max_transactions:
+            return True
+        return self.time_remaining(oldest_pending_at, now) == 0
 
 class Blockchain:
-    def __init__(self):
-        self.chain = []
+    def __init__(self, policy=None, store=None, engine=None, genesis=True):
+        # With a BlockStore the chain survives restarts; without one it lives in a plain list
+        self.store = store
+        self.chain = store if store is not None else []
         self.pending_transactions = []
-        self.create_block(previous_hash='0', proof=100)
+        self.pending_since = None
+        self.policy = policy or BlockAssemblyPolicy()
+        self.engine = engine or ProofOfWorkEngine()
+        # Hash of every block, computed once on append (a BlockStore keeps its own in the index)
+        self._hashes = []
+        self._hash_positions = {}
+        # Blocks [0, verified_upto) have already passed validation; verify() may run on
+        # several request threads at once, so the checkpoint only moves under this lock
+        self.verified_upto = 0
+        self._verify_lock = threading.Lock()
+        # genesis=False defers the genesis block (and with it the store's writer lock) to the
+        # first transaction or an explicit ensure_genesis(), so merely importing is read-only
+        if genesis:
+            self.ensure_genesis()
+
+    def ensure_genesis(self):
+        # A read-only store follows a chain owned by another process, which mines the genesis block
+        if len(self.chain) == 0 and not getattr(self.store, 'readonly', False):
+            self.create_block(previous_hash='0', proof=100)
 
     def create_block(self, proof, previous_hash):
         block = {
@@ -14,39 +97,120 @@ class Blockchain:
             'timestamp': time.time(),
             'transactions': self.pending_transactions,
             'proof': proof,
-            'previous_hash': previous_hash or self.hash(self.chain[-1])
+            'previous_hash': previous_hash or self.hash(self.chain[-1]),
+            'merkle_root': merkle_root(self.pending_transactions),
+            'difficulty': self.engine.difficulty
         }
         self.pending_transactions = []
-        self.chain.append(block)
+        self.pending_since = None
+        block_hash = self.hash(block)
+        if self.store is not None:
+            self.store.append(block, block_hash)
+        else:
+            self.chain.append(block)
+            self._hashes.append(block_hash)
+            self._hash_positions[block_hash] = len(self._hashes) - 1
         return block
 
     def get_last_block(self):
         return self.chain[-1]
 
-    def add_transaction(self, sender, receiver, amount, product_id, transaction_type):
-        self.pending_transactions.append({
+    def block_hash(self, position):
+        if self.store is not None:
+            return self.store.block_hash(position)
+        return self._hashes[position]
+
+    def get_block_by_hash(self, block_hash):
+        if self.store is not None:
+            return self.store.find_by_hash(block_hash)
+        position = self._hash_positions.get(block_hash)
+        return None if position is None else self.chain[position]
+
+    @staticmethod
+    def block_header(block):
+        return {k: v for k, v in block.items() if k != 'transactions'}
+
+    def transaction_proof(self, block, transaction_id=None, product_id=None):
+        """Inclusion proofs for the matching transactions of one block.
+
+        leafData and headerData are the exact canonical encodings that were hashed, so a
+        client can check them without reproducing Python's JSON formatting. Only blocks
+        that carry a merkle_root commit to their transactions through the header, so
+        older blocks yield no proofs.
+        """
+        if 'merkle_root' not in block:
+            return []
+        proofs = []
+        for position, tx in enumerate(block['transactions']):
+            if transaction_id is not None and tx.get('transaction_id') != transaction_id:
+                continue
+            if product_id is not None and tx.get('product_id') != product_id:
+                continue
+            proofs.append({
+                'leafData': json.dumps(tx, sort_keys=True),
+                'leafHash': merkle_leaf(tx),
+                'position': position,
+                'path': merkle_proof(block['transactions'], position),
+                'headerData': json.dumps(self.block_header(block), sort_keys=True)
+            })
+        return proofs
+
+    def sync(self):
+        if self.store is not None:
+            self.store.sync()
+
+    def refresh(self):
+        """Pick up blocks appended by another process; returns how many are new."""
+        if self.store is not None:
+            return self.store.refresh()
+        return 0
+
+    def add_transaction(self, sender, receiver, amount, product_id, transaction_type, transaction_id=None):
+        self.ensure_genesis()
+        if not self.pending_transactions:
+            self.pending_since = time.time()
+        tx = {
             'sender': sender,
             'receiver': receiver,
             'amount': amount,
             'product_id': product_id,
             'type': transaction_type
-        })
+        }
+        if transaction_id is not None:
+            tx['transaction_id'] = transaction_id
+        self.pending_transactions.append(tx)
         return self.get_last_block()['index'] + 1
 
+    def discard_pending(self):
+        self.pending_transactions = []
+        self.pending_since = None
+
+    def should_seal(self, now=None):
+        return self.policy.should_seal(len(self.pending_transactions), self.pending_since, now)
+
+    def mine_pending_block(self):
+        # Seals everything currently pending into a single block
+        if not self.pending_transactions:
+            return None
+        last_block = self.get_last_block()
+        previous_hash = self.block_hash(-1)
+        proof = self.proof_of_work(last_block['proof'])
+        return self.create_block(proof, previous_hash)
+
     def proof_of_work(self, last_proof):
-        proof = 0
-        while self.valid_proof(last_proof, proof) is False:
-            proof += 1
-        return proof
+        return self.engine.search(last_proof)
 
     @staticmethod
-    def valid_proof(last_proof, proof):
-        guess = f'{last_proof}{proof}'.encode()
-        guess_hash = hashlib.sha256(guess).hexdigest()
-        return guess_hash[:4] == "0000"
+    def valid_proof(last_proof, proof, difficulty=DEFAULT_DIFFICULTY):
+        # Blocks mined before difficulty was recorded used the default target
+        return valid_proof(last_proof, proof, difficulty)
 
     @staticmethod
     def hash(block):
+        # Blocks with a merkle_root commit to their transactions through it, so only the
+        # header is hashed; older blocks hash their full transaction list
+        if 'merkle_root' in block:
+            block = Blockchain.block_header(block)
         encoded_block = json.dumps(block, sort_keys=True).encode()
         return hashlib.sha256(encoded_block).hexdigest()
 
@@ -57,8 +221,78 @@ class Blockchain:
             block = chain[block_index]
             if block['previous_hash'] != self.hash(previous_block):
                 return False
-            if not self.valid_proof(previous_block['proof'], block['proof']):
+            if 'merkle_root' in block and block['merkle_root'] != merkle_root(block['transactions']):
+                return False
+            if not self.valid_proof(previous_block['proof'], block['proof'], block.get('difficulty', DEFAULT_DIFFICULTY)):
                 return False
             previous_block = block
             block_index += 1
         return True
+
+    def verify(self, full=False, workers=None):
+        """Validate the chain and return a report.
+
+        By default only blocks appended since the last successful check are hashed, linked
+        against the stored hash of their predecessor and proof-checked, after which the
+        checkpoint advances. full=True re-audits everything, split across a process pool
+        when workers > 1.
+        """
+        started = time.perf_counter()
+        length = len(self.chain)
+        with self._verify_lock:
+            start = 0 if full else self.verified_upto
+        stored = [self.block_hash(i) for i in range(start, length)]
+        if full and workers and workers > 1 and length - start > 1:
+            invalid = self._parallel_audit(start, length, stored, workers)
+        else:
+            invalid = self._audit(start, length, stored)
+        with self._verify_lock:
+            if invalid is not None:
+                self.verified_upto = min(self.verified_upto, invalid)
+            elif self.verified_upto >= start:
+                # Unless an overlapping check failed a block before `start` meanwhile
+                self.verified_upto = max(self.verified_upto, length)
+            verified_upto = self.verified_upto
+        return {
+            'valid': invalid is None,
+            'mode': 'full' if full else 'incremental',
+            'blocksChecked': length - start,
+            'verifiedUpTo': verified_upto,
+            'length': length,
+            'invalidBlock': None if invalid is None else invalid + 1,
+            'elapsedMs': round((time.perf_counter() - started) * 1000, 3)
+        }
+
+    def _audit_args(self, lo, hi, start, stored):
+        previous = (self.chain[lo - 1]['proof'], self.block_hash(lo - 1)) if lo else (None, None)
+        return previous + (self.chain[lo:hi], stored[lo - start:hi - start], lo)
+
+    def _audit(self, start, stop, stored):
+        return _audit_range(*self._audit_args(start, stop, start, stored))
+
+    def _parallel_audit(self, start, stop, stored, workers):
+        step = max(1, -(-(stop - start) // workers))
+        with ProcessPoolExecutor(max_workers=min(workers, os.cpu_count() or 1)) as pool:
+            futures = [
+                pool.submit(_audit_range, *self._audit_args(lo, min(lo + step, stop), start, stored))
+                for lo in range(start, stop, step)
+            ]
+            bad = [r for r in (f.result() for f in futures) if r is not None]
+        return min(bad) if bad else None
+
+def _audit_range(previous_proof, previous_hash, blocks, stored_hashes, offset):
+    # Returns the 0-based position of the first bad block, or None. Each block is hashed
+    # once and compared with its stored hash; links are checked against stored hashes.
+    # Module level so it can be shipped to a worker process.
+    for i, block in enumerate(blocks):
+        if Blockchain.hash(block) != stored_hashes[i]:
+            return offset + i
+        if 'merkle_root' in block and block['merkle_root'] != merkle_root(block['transactions']):
+            return offset + i
+        if previous_hash is not None:
+            if block['previous_hash'] != previous_hash:
+                return offset + i
+            if not Blockchain.valid_proof(previous_proof, block['proof'], block.get('difficulty', DEFAULT_DIFFICULTY)):
+                return offset + i
+        previous_proof, previous_hash = block['proof'], stored_hashes[i]
+    return None
@@ -0,0 +1,232 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, so nothing stops a second writer
+    fcntl = None
+
+# (offset into chain.log, length of the encoded block, raw 32-byte block hash)
+INDEX_RECORD = struct.Struct('<QI32s')
+
+
+class BlockStore:
+    """Append-only, on-disk block log that behaves like the in-memory chain list.
+
+    chain.log holds one canonical JSON block per line and chain.idx holds a fixed-width
+    record per block, so block N lives at index record N-1 and nothing has to be scanned
+    or decoded at startup. Blocks are paged in from a memory map on first access and kept
+    in a small LRU cache. Appends are flushed immediately but only fsynced every
+    `fsync_every` blocks or `fsync_interval` seconds, or when `sync()` is called.
+
+    Only one process may write. The first append takes an exclusive lock on chain.lock
+    (held for the life of the store) and only then repairs a torn tail, so opening a
+    store never disturbs a writer in another process. `readonly` stores, as used by web
+    workers next to a separate chain owner, pick up new blocks on `refresh()`.
+    """
+
+    def __init__(self, directory, fsync_every=32, fsync_interval=1.0, cache_size=1024, readonly=False):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.fsync_every = max(1, int(fsync_every))
+        self.fsync_interval = fsync_interval
+        self.cache_size = cache_size
+        self.readonly = readonly
+        self.lock = threading.RLock()
+        for name in ('chain.log', 'chain.idx'):
+            open(os.path.join(directory, name), 'ab').close()
+        mode = 'rb' if readonly else 'a+b'
+        self._log = open(os.path.join(directory, 'chain.log'), mode)
+        self._idx = open(os.path.join(directory, 'chain.idx'), mode)
+        self._log_map = None
+        self._idx_map = None
+        self._cache = OrderedDict()
+        self._hash_index = None
+        self._unsynced = 0
+        self._last_sync = time.time()
+        self._writer_lock = None
+        self._length = 0
+        self.refresh()
+
+    def _complete_length(self):
+        # Index records whose block is fully in the log; writers append the log line first
+        log_size = os.fstat(self._log.fileno()).st_size
+        length = os.fstat(self._idx.fileno()).st_size // INDEX_RECORD.size
+        while length:
+            offset, size, _ = self._record(length - 1)
+            if offset + size + 1 <= log_size:
+                break
+            length -= 1
+        return length
+
+    def refresh(self):
+        """Pick up blocks appended by the writing process; returns how many are new."""
+        with self.lock:
+            if self._writer_lock is not None:
+                return 0
+            length = self._complete_length()
+            added = max(0, length - self._length)
+            if added:
+                self._length = length
+                if self._hash_index is not None:
+                    for position in range(length - added, length):
+                        self._hash_index[self._record(position)[2].hex()] = position
+            return added
+
+    def acquire(self):
+        """Become the chain's single writer; raises RuntimeError if another process is."""
+        with self.lock:
+            if self._writer_lock is not None:
+                return
+            if self.readonly:
+                raise RuntimeError('Read-only block store cannot be written')
+            lock_file = open(os.path.join(self.directory, 'chain.lock'), 'a')
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    lock_file.close()
+                    raise RuntimeError(f'Block store {self.directory} is owned by another process')
+            self._writer_lock = lock_file
+            self._recover()
+
+    def _recover(self):
+        # Drop a torn index record and any log bytes that were never indexed
+        idx_size = os.fstat(self._idx.fileno()).st_size
+        log_size = os.fstat(self._log.fileno()).st_size
+        count = idx_size // INDEX_RECORD.size
+        self._idx.truncate(count * INDEX_RECORD.size)
+        self._remap()
+        self._length = count
+        while self._length:
+            offset, length, _ = self._record(self._length - 1)
+            if offset + length + 1 <= log_size:
+                break
+            self._length -= 1
+        end = 0
+        if self._length:
+            offset, length, _ = self._record(self._length - 1)
+            end = offset + length + 1
+        for m in (self._log_map, self._idx_map):
+            if m is not None:
+                m.close()
+        self._idx.truncate(self._length * INDEX_RECORD.size)
+        self._log.truncate(end)
+        self._log_end = end
+        self._remap()
+
+    def _remap(self):
+        for m in (self._log_map, self._idx_map):
+            if m is not None:
+                m.close()
+        self._log_map = self._map(self._log)
+        self._idx_map = self._map(self._idx)
+
+    @staticmethod
+    def _map(f):
+        f.flush()
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _record(self, position):
+        end = (position + 1) * INDEX_RECORD.size
+        if self._idx_map is None or end > len(self._idx_map):
+            self._remap()
+        return INDEX_RECORD.unpack_from(self._idx_map, position * INDEX_RECORD.size)
+
+    def _read(self, offset, length):
+        if self._log_map is None or offset + length > len(self._log_map):
+            self._remap()
+        return self._log_map[offset:offset + length]
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        with self.lock:
+            if position < 0:
+                position += self._length
+            if not 0 <= position < self._length:
+                raise IndexError('block index out of range')
+            block = self._cache.get(position)
+            if block is not None:
+                self._cache.move_to_end(position)
+                return block
+            offset, length, _ = self._record(position)
+            block = json.loads(self._read(offset, length))
+            self._cache[position] = block
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return block
+
+    def block_hash(self, position):
+        with self.lock:
+            if position < 0:
+                position += self._length
+            return self._record(position)[2].hex()
+
+    def find_by_hash(self, block_hash):
+        with self.lock:
+            if self._hash_index is None:
+                self._hash_index = {self._record(i)[2].hex(): i for i in range(self._length)}
+            position = self._hash_index.get(block_hash)
+            if position is None and self.readonly and self.refresh():
+                # The writer may have committed rows pointing at a block this reader has not seen yet
+                position = self._hash_index.get(block_hash)
+            return None if position is None else self[position]
+
+    def append(self, block, block_hash=None):
+        # block_hash lets the chain decide what a block's hash covers; default is the full block
+        encoded = json.dumps(block, sort_keys=True).encode()
+        digest = bytes.fromhex(block_hash) if block_hash else hashlib.sha256(encoded).digest()
+        with self.lock:
+            self.acquire()
+            offset = self._log_end
+            self._log.write(encoded + b'\n')
+            self._log.flush()
+            self._idx.write(INDEX_RECORD.pack(offset, len(encoded), digest))
+            self._idx.flush()
+            self._log_end = offset + len(encoded) + 1
+            self._cache[self._length] = block
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            if self._hash_index is not None:
+                self._hash_index[digest.hex()] = self._length
+            self._length += 1
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every or time.time() - self._last_sync >= self.fsync_interval:
+                self.sync()
+
+    def sync(self):
+        with self.lock:
+            if self._unsynced:
+                os.fsync(self._log.fileno())
+                os.fsync(self._idx.fileno())
+                self._unsynced = 0
+            self._last_sync = time.time()
+
+    def close(self):
+        with self.lock:
+            self.sync()
+            for m in (self._log_map, self._idx_map):
+                if m is not None:
+                    m.close()
+            self._log_map = self._idx_map = None
+            self._log.close()
+            self._idx.close()
+            if self._writer_lock is not None:
+                self._writer_lock.close()
+                self._writer_lock = None
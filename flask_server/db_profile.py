@@ -0,0 +1,152 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, event, text
+
+# Engine settings per database. SQLite gets WAL so readers never wait on the writer,
+# synchronous=NORMAL (durable at checkpoints, safe against corruption under WAL), a
+# memory-mapped read path, a larger page cache and a busy timeout instead of
+# immediate "database is locked" errors. Other URLs (e.g. PostgreSQL) only get pool sizing.
+
+DEFAULT_URL = 'sqlite:///agrotrace.db'
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+}
+
+
+def database_url(environ=os.environ):
+    url = environ.get('DATABASE_URL', DEFAULT_URL)
+    # Heroku-style URLs still say postgres://, which SQLAlchemy no longer accepts
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def engine_options(url, environ=os.environ):
+    """SQLALCHEMY_ENGINE_OPTIONS for `url`, sized from DB_POOL_SIZE / DB_MAX_OVERFLOW."""
+    options = {
+        'pool_size': int(environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(environ.get('DB_POOL_TIMEOUT', 30)),
+    }
+    if url.startswith('sqlite'):
+        if ':memory:' in url or url.rstrip('/') == 'sqlite:':
+            return {}
+        options['connect_args'] = {
+            'timeout': int(environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)) / 1000,
+            'check_same_thread': False,
+        }
+    else:
+        options['pool_pre_ping'] = True
+        options['pool_recycle'] = int(environ.get('DB_POOL_RECYCLE', 1800))
+    return options
+
+
+def sqlite_pragmas(environ=os.environ):
+    pragmas = dict(SQLITE_PRAGMAS)
+    pragmas['mmap_size'] = int(environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    # Negative cache_size is in KiB: 64MB of page cache per connection
+    pragmas['cache_size'] = -int(environ.get('SQLITE_CACHE_SIZE_KB', 64 * 1024))
+    pragmas['busy_timeout'] = int(environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    return pragmas
+
+
+def install(engine, environ=os.environ):
+    """Apply the SQLite pragmas to every new pooled connection of `engine`."""
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = sqlite_pragmas(environ)
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+
+
+def current_pragmas(engine):
+    if engine.dialect.name != 'sqlite':
+        return {}
+    with engine.connect() as conn:
+        return {name: conn.execute(text(f'PRAGMA {name}')).scalar() for name in sqlite_pragmas()}
+
+
+def load_test(url, profile, seconds=5.0, readers=8, writers=2, rows=2000):
+    """Mixed read/write load against a scratch table; returns operation counts and latencies.
+
+    Readers run an indexed range query, writers insert one row per transaction.
+    """
+    engine = create_engine(url, **(engine_options(url) if profile else {}))
+    if profile:
+        install(engine)
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE IF NOT EXISTS load_items (id INTEGER PRIMARY KEY, k INTEGER, v TEXT)'))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_load_items_k ON load_items (k)'))
+        conn.execute(text('INSERT INTO load_items (k, v) VALUES (:k, :v)'),
+                     [{'k': i % 100, 'v': 'x' * 64} for i in range(rows)])
+
+    deadline = time.perf_counter() + seconds
+    results = {'reads': [], 'writes': [], 'errors': 0}
+    lock = threading.Lock()
+
+    def run(kind):
+        latencies, errors, i = [], 0, 0
+        while time.perf_counter() < deadline:
+            i += 1
+            started = time.perf_counter()
+            try:
+                with engine.begin() as conn:
+                    if kind == 'reads':
+                        conn.execute(text('SELECT count(*), max(id) FROM load_items WHERE k = :k'),
+                                     {'k': i % 100}).all()
+                    else:
+                        conn.execute(text('INSERT INTO load_items (k, v) VALUES (:k, :v)'),
+                                     {'k': i % 100, 'v': 'y' * 64})
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+        with lock:
+            results[kind].extend(latencies)
+            results['errors'] += errors
+
+    threads = [threading.Thread(target=run, args=('reads',)) for _ in range(readers)]
+    threads += [threading.Thread(target=run, args=('writes',)) for _ in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    engine.dispose()
+
+    def summary(latencies):
+        latencies.sort()
+        if not latencies:
+            return {'ops': 0, 'opsPerSec': 0, 'p50Ms': None, 'p99Ms': None}
+        return {
+            'ops': len(latencies),
+            'opsPerSec': round(len(latencies) / seconds, 1),
+            'p50Ms': round(latencies[len(latencies) // 2] * 1000, 2),
+            'p99Ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+        }
+
+    return {'profile': profile, 'reads': summary(results['reads']),
+            'writes': summary(results['writes']), 'errors': results['errors']}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare SQLite defaults against the production profile')
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    args = parser.parse_args()
+    for profile in (False, True):
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite:///{os.path.join(tmp, 'load.db')}"
+            print(load_test(url, profile, args.seconds, args.readers, args.writers))
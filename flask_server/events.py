@@ -0,0 +1,160 @@
+import json
+import secrets
+import threading
+from collections import deque
+
+# In-process publish/subscribe behind the server-sent events stream. Each event is encoded
+# into its SSE frame once and handed to every matching subscriber, so a thousand open
+# dashboards cost one fan-out per event rather than a thousand polling queries. Subscribers
+# filter by event type and product; each has a bounded buffer, and a client that falls
+# behind loses its oldest events and is told how many it missed.
+
+EVENT_TYPES = ('stage', 'transaction', 'block')
+
+
+class Subscription:
+    def __init__(self, types, product_ids, buffer_size):
+        self.types = frozenset(types)
+        self.product_ids = frozenset(product_ids)
+        self.buffer = deque(maxlen=buffer_size)
+        self.dropped = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def push(self, frame):
+        with self.condition:
+            if len(self.buffer) == self.buffer.maxlen:
+                self.dropped += 1
+            self.buffer.append(frame)
+            self.condition.notify()
+
+    def wait(self, timeout):
+        """Frames queued since the last call, waiting up to `timeout` seconds for the first."""
+        with self.condition:
+            if not self.buffer:
+                self.condition.wait(timeout)
+            frames = list(self.buffer)
+            self.buffer.clear()
+            if self.dropped:
+                frames.insert(0, frame(None, 'overflow', json.dumps({'dropped': self.dropped})))
+                self.dropped = 0
+            return frames
+
+
+def frame(event_id, event_type, data):
+    head = f'id: {event_id}\n' if event_id is not None else ''
+    return f'{head}event: {event_type}\ndata: {data}\n\n'
+
+
+class EventBroker:
+    """Fan-out of (type, data) events to subscriptions, indexed by product.
+
+    Subscriptions without a product filter receive every event of their types; filtered
+    ones only events published for one of their products. The last `history` events are
+    kept so a reconnecting client (Last-Event-ID) can catch up.
+
+    Event ids are '<boot>-<sequence>'. The sequence is per broker, so a client that
+    reconnects to another worker (or after a restart) presents a foreign boot id and is
+    sent a reset instead of a replay from an unrelated sequence.
+    """
+
+    def __init__(self, buffer_size=256, history=1024, max_subscribers=1000, encode=json.dumps):
+        self.boot = secrets.token_hex(4)
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self.encode = encode
+        self.lock = threading.Lock()
+        self._all = set()
+        self._by_product = {}
+        self._history = deque(maxlen=history)
+        self._next_id = 1
+        self._subscribers = 0
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(self, types=EVENT_TYPES, product_ids=(), last_event_id=None):
+        """A new Subscription, or None when max_subscribers are already connected.
+
+        With `last_event_id` (as sent by the client), events after it still in history are
+        queued first. If the id came from another broker, or the history no longer reaches
+        back that far, a 'reset' event tells the client to refetch.
+        """
+        sub = Subscription(types, product_ids, self.buffer_size)
+        reset = frame(None, 'reset', json.dumps({'lastEventId': last_event_id}))
+        sequence = self.sequence(last_event_id)
+        with self.lock:
+            if self._subscribers >= self.max_subscribers:
+                return None
+            self._subscribers += 1
+            if sub.product_ids:
+                for product_id in sub.product_ids:
+                    self._by_product.setdefault(product_id, set()).add(sub)
+            else:
+                self._all.add(sub)
+            if last_event_id and sequence is None:
+                sub.push(reset)
+            elif sequence is not None:
+                oldest = self._history[0][0] if self._history else self._next_id
+                if sequence < oldest - 1:
+                    sub.push(reset)
+                for event_id, event_type, product_ids, encoded in self._history:
+                    if event_id > sequence and self._matches(sub, event_type, product_ids):
+                        sub.push(encoded)
+        return sub
+
+    def sequence(self, event_id):
+        """The sequence number of one of this broker's event ids, else None."""
+        boot, _, sequence = (event_id or '').partition('-')
+        if boot != self.boot or not sequence.isdigit():
+            return None
+        return int(sequence)
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            if sub.closed:
+                return
+            sub.closed = True
+            self._subscribers -= 1
+            self._all.discard(sub)
+            for product_id in sub.product_ids:
+                subs = self._by_product.get(product_id)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._by_product[product_id]
+
+    @staticmethod
+    def _matches(sub, event_type, product_ids):
+        return event_type in sub.types and (not sub.product_ids or not sub.product_ids.isdisjoint(product_ids))
+
+    def publish(self, event_type, data, product_ids=()):
+        product_ids = tuple(product_ids)
+        payload = self.encode(data)
+        with self.lock:
+            event_id = self._next_id
+            self._next_id += 1
+            encoded = frame(f'{self.boot}-{event_id}', event_type, payload)
+            self._history.append((event_id, event_type, product_ids, encoded))
+            targets = set(self._all)
+            for product_id in product_ids:
+                targets.update(self._by_product.get(product_id, ()))
+            # Pushed under the lock so every subscriber sees events in id order
+            delivered = 0
+            for sub in targets:
+                if event_type in sub.types:
+                    sub.push(encoded)
+                    delivered += 1
+            self.published += 1
+            self.delivered += delivered
+        return f'{self.boot}-{event_id}'
+
+    def stats(self):
+        with self.lock:
+            return {
+                'subscribers': self._subscribers,
+                'maxSubscribers': self.max_subscribers,
+                'bufferSize': self.buffer_size,
+                'published': self.published,
+                'delivered': self.delivered,
+                'lastEventId': f'{self.boot}-{self._next_id - 1}'
+            }
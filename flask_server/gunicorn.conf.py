@@ -0,0 +1,37 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+
+# gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Workers are forked web servers with a read-only view of the chain; one separate
+# `flask --app app chain-owner` process mines. Schema creation and seeding run once in the
+# master before any worker starts, not in every worker.
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# Threads by default. Every open /api/events stream holds a thread for its whole life, so
+# thread workers reserve most threads for API requests (see EVENTS_MAX_SUBSCRIBERS below).
+# GUNICORN_WORKER_CLASS=gevent (pip install gevent) serves streams as greenlets instead.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+accesslog = '-'
+raw_env = [f"CHAIN_ROLE={os.environ.get('CHAIN_ROLE', 'reader')}"]
+if worker_class in ('gthread', 'sync') and 'EVENTS_MAX_SUBSCRIBERS' not in os.environ:
+    # A quarter of the threads at most; further streams get 503 and the pages fall back to polling
+    raw_env.append(f"EVENTS_MAX_SUBSCRIBERS={threads // 4 if worker_class == 'gthread' else 0}")
+
+
+def on_starting(server):
+    # DB_INIT_ON_START=0 when the database is initialised by a separate release step
+    if os.environ.get('DB_INIT_ON_START', '1') != '1':
+        return
+    env = dict(os.environ, CHAIN_ROLE='reader')
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'db-init'],
+                   cwd=os.path.dirname(os.path.abspath(__file__)), env=env, check=True)
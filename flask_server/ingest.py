@@ -0,0 +1,96 @@
+import csv
+import io
+import json
+import math
+from datetime import datetime
+from itertools import islice
+
+# Row parsing and validation for bulk product uploads; no app imports, the route does the inserts
+
+REQUIRED_FIELDS = ('name', 'productType', 'batchNumber', 'quantity', 'unit')
+TEXT_FIELDS = ('name', 'description', 'productType', 'batchNumber', 'unit', 'location')
+
+
+def iter_rows(stream, content_type, json_body=None):
+    """Yield upload rows as dicts from a JSON array, NDJSON lines or CSV with a header row."""
+    if content_type in ('application/x-ndjson', 'application/jsonl', 'application/ndjson'):
+        for line in io.TextIOWrapper(stream, encoding='utf-8'):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield {'_error': f'Invalid JSON: {e}'}
+    elif content_type == 'text/csv':
+        yield from csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8', newline=''))
+    else:
+        if not isinstance(json_body, list):
+            raise ValueError('Expected a JSON array of products')
+        yield from json_body
+
+
+def chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def parse_date_column(values):
+    """Parse one date column for a whole chunk; each distinct string is parsed once.
+
+    Harvest uploads repeat the same few dates across thousands of lots, so the parse cost
+    is per distinct value rather than per row. Unparseable values, and anything other than
+    a string (JSON numbers, arrays, objects), map to ValueError.
+    """
+    parsed = {None: None, '': None}
+    for value in {v for v in values if isinstance(v, str)} - parsed.keys():
+        try:
+            parsed[value] = int(datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp())
+        except ValueError:
+            parsed[value] = ValueError
+    return [parsed[v] if v is None or isinstance(v, str) else ValueError for v in values]
+
+
+def validate_chunk(rows):
+    """Return (valid, errors): valid is a list of (row offset, normalised fields) pairs."""
+    harvest = parse_date_column([row.get('harvestDate') if isinstance(row, dict) else None for row in rows])
+    expiry = parse_date_column([row.get('expiryDate') if isinstance(row, dict) else None for row in rows])
+    valid, errors = [], []
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors.append((i, ['Row must be an object']))
+            continue
+        if '_error' in row:
+            errors.append((i, [row['_error']]))
+            continue
+        problems = [f'{field} is required' for field in REQUIRED_FIELDS if row.get(field) in (None, '')]
+        problems += [f'{field} must be a string' for field in TEXT_FIELDS if isinstance(row.get(field), (list, dict))]
+        try:
+            quantity = float(row.get('quantity'))
+            if not math.isfinite(quantity):
+                problems.append('quantity must be a finite number')
+            elif quantity < 0:
+                problems.append('quantity must not be negative')
+        except (TypeError, ValueError):
+            quantity = None
+            if row.get('quantity') not in (None, ''):
+                problems.append('quantity must be a number')
+        if harvest[i] is ValueError:
+            problems.append('harvestDate is not an ISO 8601 date')
+        if expiry[i] is ValueError:
+            problems.append('expiryDate is not an ISO 8601 date')
+        if problems:
+            errors.append((i, problems))
+            continue
+        valid.append((i, {
+            'name': row['name'], 'description': row.get('description') or None,
+            'product_type': row['productType'], 'batch_number': str(row['batchNumber']),
+            'quantity': quantity, 'unit': row['unit'],
+            'harvest_date': harvest[i], 'expiry_date': expiry[i],
+            'location': row.get('location') or 'Farm Location'
+        }))
+    return valid, errors
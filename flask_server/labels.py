@@ -0,0 +1,95 @@
+import io
+import json
+import os
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import qrcode
+from PIL import Image, ImageDraw
+from qrcode.image.svg import SvgPathFillImage
+
+# Kept free of Flask/app imports so worker processes stay cheap to start
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def render_qr_png(content, fill_color="black"):
+    qr = qrcode.QRCode(version=1, box_size=10, border=1)
+    qr.add_data(content)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color=fill_color, back_color="white")
+    buffered = io.BytesIO()
+    img.save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+def render_qr_svg(content, fill_color="black"):
+    # One <path> on a white background; the module colour is set through the path style
+    factory = type('QRSvgImage', (SvgPathFillImage,), {
+        'QR_PATH_STYLE': dict(SvgPathFillImage.QR_PATH_STYLE, fill=fill_color)
+    })
+    qr = qrcode.QRCode(version=1, box_size=10, border=1, image_factory=factory)
+    qr.add_data(content)
+    qr.make(fit=True)
+    buffered = io.BytesIO()
+    qr.make_image().save(buffered)
+    return buffered.getvalue()
+
+
+def _render_job(job):
+    return render_qr_png(*job)
+
+
+def render_many(jobs, workers=None, inline_below=32):
+    """Render (content, fill_color) jobs, in a shared process pool when there are enough of them."""
+    if len(jobs) < inline_below:
+        return [render_qr_png(*job) for job in jobs]
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+    chunksize = max(1, len(jobs) // ((workers or os.cpu_count() or 1) * 4))
+    return list(_pool.map(_render_job, jobs, chunksize=chunksize))
+
+
+def _safe_name(name):
+    return ''.join(c if c.isalnum() or c in '-_.' else '_' for c in name)
+
+
+def build_zip(labels, pngs):
+    # Spools to disk past 32MB so a 10k-label job does not have to sit in memory
+    out = tempfile.SpooledTemporaryFile(max_size=32 * 1024 * 1024)
+    with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_STORED) as zf:
+        for label, png in zip(labels, pngs):
+            zf.writestr(f"{_safe_name(label['productInfo']['batchNumber'])}.png", png)
+        zf.writestr('labels.json', json.dumps(labels, indent=2))
+    out.seek(0)
+    return out
+
+
+def build_sheet(labels, pngs, columns=3, rows=4, cell=(400, 460)):
+    """Lay labels out on A4-ish pages and return a multi-page PDF."""
+    per_page = columns * rows
+    pages = []
+    for start in range(0, len(labels), per_page):
+        # Bilevel pages keep a many-page PDF small; QR codes and text are black on white anyway
+        page = Image.new('1', (columns * cell[0], rows * cell[1]), 1)
+        draw = ImageDraw.Draw(page)
+        for i, (label, png) in enumerate(zip(labels[start:start + per_page], pngs[start:start + per_page])):
+            x, y = (i % columns) * cell[0], (i // columns) * cell[1]
+            qr = Image.open(io.BytesIO(png)).convert('1')
+            qr.thumbnail((cell[0] - 40, cell[1] - 100))
+            page.paste(qr, (x + (cell[0] - qr.width) // 2, y + 20))
+            info = label['productInfo']
+            text_y = y + 30 + qr.height
+            for line in (info['name'], info['batchNumber'], f"{info['quantity']}  |  Harvest {info['harvestDate']}"):
+                draw.text((x + 20, text_y), str(line), fill=0)
+                text_y += 16
+        pages.append(page)
+    out = tempfile.SpooledTemporaryFile(max_size=32 * 1024 * 1024)
+    if pages:
+        pages[0].save(out, format='PDF', save_all=True, append_images=pages[1:], resolution=150)
+    out.seek(0)
+    return out
@@ -0,0 +1,108 @@
+import time
+
+from sqlalchemy import text
+
+import analytics
+import search
+
+# Ordered, append-only. Each step is SQL text or a callable taking the connection.
+# Index DDL uses IF NOT EXISTS because db.create_all() already builds these on fresh databases.
+MIGRATIONS = [
+    ('0001_hot_path_indexes', [
+        'CREATE INDEX IF NOT EXISTS ix_products_created_by_created_at ON products (created_by, created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_products_status_created_at ON products (status, created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_products_product_type_created_at ON products (product_type, created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_products_created_at_id ON products (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_supply_chain_stages_product_id_timestamp ON supply_chain_stages (product_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS ix_transactions_product_id_created_at ON transactions (product_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_transactions_from_user_id_created_at ON transactions (from_user_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_transactions_to_user_id_created_at ON transactions (to_user_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_transactions_status ON transactions (status)',
+        'CREATE INDEX IF NOT EXISTS ix_verifications_product_id ON verifications (product_id)',
+    ]),
+    # Keyset pagination orders by (created_at, id), so the filter indexes carry id as well
+    ('0002_keyset_indexes', [
+        'DROP INDEX IF EXISTS ix_products_created_by_created_at',
+        'DROP INDEX IF EXISTS ix_products_status_created_at',
+        'DROP INDEX IF EXISTS ix_products_product_type_created_at',
+        'DROP INDEX IF EXISTS ix_transactions_product_id_created_at',
+        'DROP INDEX IF EXISTS ix_transactions_from_user_id_created_at',
+        'DROP INDEX IF EXISTS ix_transactions_to_user_id_created_at',
+        'CREATE INDEX IF NOT EXISTS ix_products_created_by_created_at_id ON products (created_by, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_products_status_created_at_id ON products (status, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_products_product_type_created_at_id ON products (product_type, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_transactions_product_id_created_at_id ON transactions (product_id, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_transactions_from_user_id_created_at_id ON transactions (from_user_id, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_transactions_to_user_id_created_at_id ON transactions (to_user_id, created_at, id)',
+    ]),
+    # FTS5 trigram index (SQLite) or pg_trgm GIN indexes (PostgreSQL) behind product search
+    ('0003_product_search', [
+        search.install,
+    ]),
+    # Bulk product uploads index their rows in one statement instead of through the per-row trigger
+    ('0004_search_bulk_sync', [
+        search.install_bulk_sync,
+    ]),
+    # Dashboard counters, filled from existing rows once and kept current by the app's flush hooks
+    ('0005_stats_daily', [
+        'CREATE TABLE IF NOT EXISTS stats_daily (farmer_id VARCHAR NOT NULL, day INTEGER NOT NULL, '
+        'products INTEGER NOT NULL, yield_total FLOAT NOT NULL, transactions INTEGER NOT NULL, '
+        'revenue FLOAT NOT NULL, active_shipments INTEGER NOT NULL, PRIMARY KEY (farmer_id, day))',
+        analytics.rebuild,
+    ]),
+    # Hourly and daily rollups behind /api/analytics/timeseries, plus the indexes the backfill windows use
+    ('0006_timeseries_rollups', [
+        'CREATE INDEX IF NOT EXISTS ix_transactions_created_at ON transactions (created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_supply_chain_stages_timestamp ON supply_chain_stages (timestamp)',
+        'CREATE TABLE IF NOT EXISTS rollup_hourly (event VARCHAR NOT NULL, bucket INTEGER NOT NULL, '
+        'product_type VARCHAR NOT NULL, count INTEGER NOT NULL, quantity FLOAT NOT NULL, amount FLOAT NOT NULL, '
+        'PRIMARY KEY (event, bucket, product_type))',
+        'CREATE TABLE IF NOT EXISTS rollup_daily (event VARCHAR NOT NULL, bucket INTEGER NOT NULL, '
+        'product_type VARCHAR NOT NULL, count INTEGER NOT NULL, quantity FLOAT NOT NULL, amount FLOAT NOT NULL, '
+        'PRIMARY KEY (event, bucket, product_type))',
+        analytics.backfill_rollups_in,
+    ]),
+]
+
+
+def upgrade(engine):
+    """Apply every migration not yet recorded in schema_migrations; returns the ids applied."""
+    applied_now = []
+    with engine.begin() as conn:
+        conn.execute(text(
+            'CREATE TABLE IF NOT EXISTS schema_migrations (id VARCHAR PRIMARY KEY, applied_at INTEGER NOT NULL)'
+        ))
+        applied = {row[0] for row in conn.execute(text('SELECT id FROM schema_migrations'))}
+        for migration_id, steps in MIGRATIONS:
+            if migration_id in applied:
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(text(step))
+            conn.execute(text('INSERT INTO schema_migrations (id, applied_at) VALUES (:id, :at)'),
+                         {'id': migration_id, 'at': int(time.time())})
+            applied_now.append(migration_id)
+    return applied_now
+
+
+def full_scans(engine, queries):
+    """Run EXPLAIN QUERY PLAN over named queries and return those that scan a whole table.
+
+    `queries` maps a name to a SQLAlchemy select. A plan step of the form "SCAN <table>"
+    without an index is a full scan; ordered scans "USING INDEX" are fine. Only SQLite
+    plans are understood, other dialects return no findings.
+    """
+    if engine.dialect.name != 'sqlite':
+        return {}
+    findings = {}
+    with engine.connect() as conn:
+        for name, query in queries.items():
+            sql = str(query.compile(engine, compile_kwargs={'literal_binds': True}))
+            plan = [row[-1] for row in conn.execute(text(f'EXPLAIN QUERY PLAN {sql}'))]
+            scans = [step for step in plan
+                     if step.startswith('SCAN') and 'INDEX' not in step and not step.startswith('SCAN CONSTANT')]
+            if scans:
+                findings[name] = plan
+    return findings
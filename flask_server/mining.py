@@ -0,0 +1,270 @@
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class MiningQueue:
+    """Background miner: requests enqueue transfers, a worker pool batches them into blocks.
+
+    Each worker drains the queue until the chain's BlockAssemblyPolicy says to seal,
+    so one proof-of-work covers every transaction in the batch.
+    """
+
+    def __init__(self, blockchain, on_mined, on_failed=None, workers=1, maxsize=1000, history=1000):
+        self.blockchain = blockchain
+        self.on_mined = on_mined
+        self.on_failed = on_failed
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=maxsize)
+        # Workers may overlap on callbacks, but only one may extend the chain at a time
+        self.chain_lock = threading.Lock()
+        # Recent tickets only; callers fall back to the database for older ones
+        self.tickets = OrderedDict()
+        # Tickets queued or being mined; unlike `tickets` never evicted while in flight
+        self.active = set()
+        self.max_tickets = history
+        self.lock = threading.Lock()
+        self.wait_times = deque(maxlen=history)
+        self.mine_times = deque(maxlen=history)
+        self.processed = 0
+        self.blocks_mined = 0
+        self.failed = 0
+        self.rejected = 0
+        # Batches that made it onto the chain but whose on_mined callback raised:
+        # (tickets, block, block_hash, error). They are mined, not failed.
+        self.unrecorded = []
+        self.in_flight = 0
+        self._threads = []
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f'miner-{i}', daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, ticket, tx):
+        self.start()
+        job = {'ticket': ticket, 'tx': tx, 'enqueued_at': time.time()}
+        self._set_ticket(ticket, status='queued', enqueuedAt=job['enqueued_at'])
+        with self.lock:
+            self.active.add(ticket)
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            with self.lock:
+                self.rejected += 1
+                self.tickets.pop(ticket, None)
+                self.active.discard(ticket)
+            raise QueueFullError('Mining queue is full')
+        return ticket
+
+    def tracked(self):
+        """Tickets queued, being mined, or mined here but not yet recorded.
+
+        Take this before reading pending rows: a ticket leaves the set only after its
+        rows are committed, so a row still pending in a later read is either in this
+        snapshot or not being handled here.
+        """
+        with self.lock:
+            return self.active.union(*(entry[0] for entry in self.unrecorded))
+
+    def retry_unrecorded(self):
+        """Run on_mined again for blocks whose first attempt raised; returns how many succeeded."""
+        with self.lock:
+            entries, self.unrecorded = self.unrecorded, []
+        recorded = 0
+        for tickets, block, block_hash, error in entries:
+            try:
+                self._record(tickets, block, block_hash)
+            except Exception as e:
+                with self.lock:
+                    self.unrecorded.append((tickets, block, block_hash, str(e)))
+                continue
+            recorded += 1
+            for ticket in tickets:
+                self._set_ticket(ticket, status='verified', error=None, completedAt=time.time())
+        return recorded
+
+    def ticket_status(self, ticket):
+        with self.lock:
+            info = self.tickets.get(ticket)
+            return dict(info) if info else None
+
+    def _set_ticket(self, ticket, **fields):
+        with self.lock:
+            self.tickets.setdefault(ticket, {}).update(fields)
+            self.tickets.move_to_end(ticket)
+            while len(self.tickets) > self.max_tickets:
+                self.tickets.popitem(last=False)
+
+    def _collect_batch(self):
+        # Block for the first job, then keep draining until the assembly policy says seal
+        policy = self.blockchain.policy
+        batch = [self.queue.get()]
+        oldest = batch[0]['enqueued_at']
+        while not policy.should_seal(len(batch), oldest):
+            try:
+                batch.append(self.queue.get(timeout=policy.time_remaining(oldest)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _mine(self, batch):
+        with self.chain_lock:
+            try:
+                for job in batch:
+                    tx = job['tx']
+                    self.blockchain.add_transaction(tx['sender'], tx['receiver'], tx['amount'], tx['product_id'],
+                                                    tx['type'], transaction_id=job['ticket'])
+                block = self.blockchain.mine_pending_block()
+            except Exception:
+                # Nothing was appended; don't let the batch be sealed into the next block
+                self.blockchain.discard_pending()
+                raise
+            return block, self.blockchain.block_hash(block['index'] - 1)
+
+    def _record(self, tickets, block, block_hash):
+        # Make the block durable before any database row points at it
+        self.blockchain.sync()
+        self.on_mined(tickets, block, block_hash)
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            tickets = [job['ticket'] for job in batch]
+            started = time.time()
+            with self.lock:
+                self.in_flight += len(batch)
+                self.wait_times.extend(started - job['enqueued_at'] for job in batch)
+            for ticket in tickets:
+                self._set_ticket(ticket, status='mining', startedAt=started)
+            try:
+                try:
+                    block, block_hash = self._mine(batch)
+                except Exception as e:
+                    with self.lock:
+                        self.failed += len(batch)
+                    for ticket in tickets:
+                        self._set_ticket(ticket, status='failed', error=str(e), completedAt=time.time())
+                    if self.on_failed:
+                        self.on_failed(tickets, e)
+                    continue
+                with self.lock:
+                    self.processed += len(batch)
+                    self.blocks_mined += 1
+                try:
+                    self._record(tickets, block, block_hash)
+                except Exception as e:
+                    # On chain but not in the database yet: not a failed transaction
+                    with self.lock:
+                        self.unrecorded.append((tickets, block, block_hash, str(e)))
+                    for ticket in tickets:
+                        self._set_ticket(ticket, status='unrecorded', error=str(e), blockIndex=block['index'],
+                                         blockchainHash=block_hash, completedAt=time.time())
+                    continue
+                for ticket in tickets:
+                    self._set_ticket(ticket, status='verified', blockIndex=block['index'],
+                                     blockchainHash=block_hash, completedAt=time.time())
+            finally:
+                with self.lock:
+                    self.mine_times.append(time.time() - started)
+                    self.in_flight -= len(batch)
+                    self.active.difference_update(tickets)
+                for _ in batch:
+                    self.queue.task_done()
+
+    @staticmethod
+    def _summary(samples):
+        if not samples:
+            return {'count': 0, 'avgMs': None, 'p50Ms': None, 'p95Ms': None, 'maxMs': None}
+        ordered = sorted(samples)
+        n = len(ordered)
+        return {
+            'count': n,
+            'avgMs': round(sum(ordered) / n * 1000, 3),
+            'p50Ms': round(ordered[n // 2] * 1000, 3),
+            'p95Ms': round(ordered[min(n - 1, int(n * 0.95))] * 1000, 3),
+            'maxMs': round(ordered[-1] * 1000, 3)
+        }
+
+    def stats(self):
+        with self.lock:
+            wait_times, mine_times = list(self.wait_times), list(self.mine_times)
+            unrecorded = sum(len(entry[0]) for entry in self.unrecorded)
+        return {
+            'workers': self.workers,
+            'queueDepth': self.queue.qsize(),
+            'queueCapacity': self.queue.maxsize,
+            'inFlight': self.in_flight,
+            'processed': self.processed,
+            'blocksMined': self.blocks_mined,
+            'avgTransactionsPerBlock': round(self.processed / self.blocks_mined, 2) if self.blocks_mined else None,
+            'maxTransactionsPerBlock': self.blockchain.policy.max_transactions,
+            'maxBlockWaitMs': self.blockchain.policy.max_wait_ms,
+            'difficulty': self.blockchain.engine.difficulty,
+            'powWorkers': self.blockchain.engine.workers,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'unrecorded': unrecorded,
+            'waitLatency': self._summary(wait_times),
+            'miningLatency': self._summary(mine_times)
+        }
+
+
+class ChainFollower:
+    """Polls a chain owned by another process and reports the blocks it appends.
+
+    Web workers run with a read-only BlockStore. `on_blocks(blocks)` is called from the
+    follower thread with each run of new blocks in chain order; returning False defers
+    them to the next poll (e.g. while the owner's database update is still in flight),
+    at most `max_deferrals` times in a row.
+    """
+
+    def __init__(self, blockchain, on_blocks, interval=1.0, max_deferrals=5):
+        self.blockchain = blockchain
+        self.on_blocks = on_blocks
+        self.interval = interval
+        self.max_deferrals = max_deferrals
+        self.position = len(blockchain.chain)
+        self.blocks_seen = 0
+        self._deferrals = 0
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='chain-follower', daemon=True)
+            self._thread.start()
+
+    def poll(self):
+        self.blockchain.refresh()
+        length = len(self.blockchain.chain)
+        if length <= self.position:
+            return 0
+        blocks = self.blockchain.chain[self.position:length]
+        if self.on_blocks(blocks) is False and self._deferrals < self.max_deferrals:
+            self._deferrals += 1
+            return 0
+        self._deferrals = 0
+        self.position = length
+        self.blocks_seen += len(blocks)
+        return len(blocks)
+
+    def _run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Chain follower: {e}")
+            time.sleep(self.interval)
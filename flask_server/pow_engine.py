@@ -0,0 +1,130 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Leading zero bits required of sha256(f'{last_proof}{proof}'); 16 bits is the old "0000" hex prefix
+DEFAULT_DIFFICULTY = 16
+
+
+def _target(difficulty):
+    # Whole zero bytes to match as a prefix, plus a mask for the leftover high bits of the next byte
+    full, rem = divmod(difficulty, 8)
+    mask = (0xFF << (8 - rem)) & 0xFF if rem else 0
+    return b'\x00' * full, mask, full
+
+
+def meets_target(digest, difficulty=DEFAULT_DIFFICULTY):
+    zeros, mask, full = _target(difficulty)
+    return digest.startswith(zeros) and not (mask and digest[full] & mask)
+
+
+def valid_proof(last_proof, proof, difficulty=DEFAULT_DIFFICULTY):
+    return meets_target(hashlib.sha256(f'{last_proof}{proof}'.encode()).digest(), difficulty)
+
+
+def search_range(last_proof, start, stop, difficulty=DEFAULT_DIFFICULTY):
+    """Return the first nonce in [start, stop) that meets the target, or None."""
+    zeros, mask, full = _target(difficulty)
+    # The last_proof prefix is hashed once; each nonce only costs a state copy and one update
+    base = hashlib.sha256(str(last_proof).encode())
+    for nonce in range(start, stop):
+        h = base.copy()
+        h.update(str(nonce).encode())
+        digest = h.digest()
+        if digest.startswith(zeros) and not (mask and digest[full] & mask):
+            return nonce
+    return None
+
+
+class ProofOfWorkEngine:
+    """Nonce search with a configurable difficulty, optionally fanned out over processes.
+
+    Nonces are searched in chunks of `chunk_size`. With workers > 1 each round hands one
+    chunk to every worker and keeps the lowest hit, so the result is the same nonce a
+    serial search would have found.
+    """
+
+    def __init__(self, difficulty=DEFAULT_DIFFICULTY, workers=1, chunk_size=50000):
+        self.difficulty = int(difficulty)
+        self.workers = max(1, int(workers))
+        self.chunk_size = max(1, int(chunk_size))
+        self._pool = None
+
+    def valid(self, last_proof, proof, difficulty=None):
+        return valid_proof(last_proof, proof, self.difficulty if difficulty is None else difficulty)
+
+    def search(self, last_proof):
+        if self.workers == 1:
+            return self._search_serial(last_proof)
+        return self._search_parallel(last_proof)
+
+    def _search_serial(self, last_proof):
+        start = 0
+        while True:
+            nonce = search_range(last_proof, start, start + self.chunk_size, self.difficulty)
+            if nonce is not None:
+                return nonce
+            start += self.chunk_size
+
+    def _search_parallel(self, last_proof):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        start = 0
+        while True:
+            futures = [
+                self._pool.submit(search_range, last_proof, start + i * self.chunk_size,
+                                  start + (i + 1) * self.chunk_size, self.difficulty)
+                for i in range(self.workers)
+            ]
+            hits = [n for n in (f.result() for f in futures) if n is not None]
+            if hits:
+                return min(hits)
+            start += self.workers * self.chunk_size
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+def _hash_rate(hashes):
+    # Difficulty 256 can never be met, so this measures raw hashing throughput
+    started = time.perf_counter()
+    search_range(100, 0, hashes, 256)
+    return hashes / (time.perf_counter() - started)
+
+
+def benchmark(seconds=2.0, workers=1, target_ms=1000):
+    """Measure hashes per second and suggest a difficulty for the target block time."""
+    hashes = int(_hash_rate(20000) * seconds / max(workers, 1)) or 1
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            started = time.perf_counter()
+            list(pool.map(search_range, [100] * workers, [0] * workers, [hashes] * workers, [256] * workers))
+            rate = hashes * workers / (time.perf_counter() - started)
+    else:
+        rate = _hash_rate(hashes)
+    # Expected work for d zero bits is 2**d hashes
+    suggested = max(0, int(math.log2(rate * target_ms / 1000.0)))
+    return {
+        'workers': workers,
+        'hashesPerSecond': round(rate),
+        'targetBlockMs': target_ms,
+        'suggestedDifficulty': suggested,
+        'expectedMsByDifficulty': {
+            d: round((2 ** d) / rate * 1000, 3) for d in range(max(0, suggested - 4), suggested + 5)
+        }
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the proof-of-work engine on this machine')
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--target-ms', type=int, default=1000)
+    args = parser.parse_args()
+    print(json.dumps(benchmark(args.seconds, args.workers, args.target_ms), indent=2))
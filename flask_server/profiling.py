@@ -0,0 +1,225 @@
+import bisect
+import cProfile
+import functools
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+
+# Opt-in request profiling: per-route latency histograms, SQL query count/time per request,
+# named spans around hot functions, a Prometheus text endpoint and sampled cProfile dumps
+# of slow requests. Nothing is hooked unless Profiler.init_app runs with PROFILING enabled.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Histograms and counters keyed by metric name and label values."""
+
+    def __init__(self, prefix='agrotrace'):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.help = {}
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    @staticmethod
+    def _labels(pairs, extra=()):
+        pairs = list(pairs) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                              for k, v in pairs) + '}'
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self.lock:
+            seen = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                full = f'{self.prefix}_{name}'
+                if full not in seen:
+                    seen.add(full)
+                    if name in self.help:
+                        lines.append(f'# HELP {full} {self.help[name]}')
+                    lines.append(f'# TYPE {full} counter')
+                lines.append(f'{full}{self._labels(labels)} {value}')
+            for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                full = f'{self.prefix}_{name}'
+                if full not in seen:
+                    seen.add(full)
+                    if name in self.help:
+                        lines.append(f'# HELP {full} {self.help[name]}')
+                    lines.append(f'# TYPE {full} histogram')
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{full}_bucket{self._labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{full}_bucket{self._labels(labels, [("le", "+Inf")])} {histogram.count}')
+                lines.append(f'{full}_sum{self._labels(labels)} {histogram.sum:.6f}')
+                lines.append(f'{full}_count{self._labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+class Profiler:
+    def __init__(self, app=None, engine=None):
+        self.registry = Registry()
+        self.enabled = False
+        self._profile_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, engine)
+
+    def init_app(self, app, engine=None):
+        app.config.setdefault('PROFILING', os.environ.get('PROFILING', '0') == '1')
+        app.config.setdefault('PROFILE_SLOW_MS', int(os.environ.get('PROFILE_SLOW_MS', 500)))
+        app.config.setdefault('PROFILE_SAMPLE_RATE', float(os.environ.get('PROFILE_SAMPLE_RATE', 0.0)))
+        app.config.setdefault('PROFILE_DIR', os.environ.get('PROFILE_DIR', os.path.join(app.instance_path, 'profiles')))
+        self.enabled = app.config['PROFILING']
+        if not self.enabled:
+            return
+        self.slow_ms = app.config['PROFILE_SLOW_MS']
+        self.sample_rate = app.config['PROFILE_SAMPLE_RATE']
+        self.profile_dir = app.config['PROFILE_DIR']
+
+        r = self.registry
+        r.describe('http_request_duration_seconds', 'Request latency by route, method and status.')
+        r.describe('http_requests_total', 'Requests by route, method and status.')
+        r.describe('sql_queries_per_request', 'SQL statements executed per request.')
+        r.describe('sql_query_duration_seconds', 'Latency of individual SQL statements.')
+        r.describe('span_duration_seconds', 'Time spent in instrumented functions.')
+        r.describe('slow_request_profiles_total', 'cProfile dumps written for slow sampled requests.')
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+        if engine is not None:
+            self.instrument_engine(engine)
+
+    # Spans
+
+    @contextmanager
+    def span(self, name):
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.registry.observe('span_duration_seconds', elapsed, span=name)
+            if has_request_context() and '_profiling' in g:
+                spans = g._profiling['spans']
+                spans[name] = spans.get(name, 0.0) + elapsed
+
+    def timed(self, name, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with self.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def instrument(self, obj, attribute, name):
+        """Replace obj.attribute (a function or bound method) with a timed wrapper."""
+        if self.enabled:
+            setattr(obj, attribute, self.timed(name, getattr(obj, attribute)))
+
+    # SQL
+
+    def instrument_engine(self, engine):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def start_query(conn, cursor, statement, parameters, context, executemany):
+            context._profiling_started = time.perf_counter()
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def end_query(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - context._profiling_started
+            self.registry.observe('sql_query_duration_seconds', elapsed)
+            if has_request_context() and '_profiling' in g:
+                g._profiling['sql_count'] += 1
+                g._profiling['sql_time'] += elapsed
+
+    # Request hooks
+
+    def _before_request(self):
+        g._profiling = {'started': time.perf_counter(), 'sql_count': 0, 'sql_time': 0.0, 'spans': {}, 'profile': None}
+        if self.sample_rate and random.random() < self.sample_rate and self._profile_lock.acquire(blocking=False):
+            # One sampled profile at a time; cProfile only sees this request's thread
+            profile = cProfile.Profile()
+            profile.enable()
+            g._profiling['profile'] = profile
+
+    def _route(self):
+        return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+    def _after_request(self, response):
+        state = g.get('_profiling')
+        if state is None:
+            return response
+        elapsed = time.perf_counter() - state['started']
+        route, method, status = self._route(), request.method, response.status_code
+        if route == '/metrics':
+            return response
+        self.registry.observe('http_request_duration_seconds', elapsed, route=route, method=method, status=status)
+        self.registry.inc('http_requests_total', route=route, method=method, status=status)
+        self.registry.observe('sql_queries_per_request', state['sql_count'], buckets=COUNT_BUCKETS, route=route)
+        timings = [f'app;dur={elapsed * 1000:.1f}',
+                   f'sql;dur={state["sql_time"] * 1000:.1f};desc="{state["sql_count"]} queries"']
+        timings += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in state['spans'].items()]
+        response.headers['Server-Timing'] = ', '.join(timings)
+        state['elapsed'] = elapsed
+        return response
+
+    def _teardown_request(self, exc):
+        state = g.pop('_profiling', None)
+        if state is None or state['profile'] is None:
+            return
+        profile = state['profile']
+        profile.disable()
+        try:
+            elapsed = state.get('elapsed', time.perf_counter() - state['started'])
+            if elapsed * 1000 >= self.slow_ms:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                route = self._route().strip('/').replace('/', '_').replace('<', '').replace('>', '') or 'root'
+                profile.dump_stats(os.path.join(self.profile_dir, f'{int(time.time() * 1000)}-{route}.prof'))
+                self.registry.inc('slow_request_profiles_total', route=self._route())
+        finally:
+            self._profile_lock.release()
+
+    def metrics_view(self):
+        return Response(self.registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,141 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+
+class QRRenderCache:
+    """Bounded LRU of rendered QR images, with an optional on-disk second tier.
+
+    Entries are keyed by a digest of what was encoded plus how it was drawn, so identical
+    payloads share one render. Keys are also tracked per product so a product's renders
+    can be dropped when its state changes; a key leaves that index with its last copy
+    (memory eviction, or disk pruning when there is a disk tier).
+    """
+
+    def __init__(self, max_entries=1024, disk_dir=None, disk_max_entries=10000):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_max_entries = disk_max_entries
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._product_keys = {}
+        self._key_products = {}
+        self._disk_writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(*parts):
+        return hashlib.sha256('\x1f'.join(str(p) for p in parts).encode()).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f'{key}.qr')
+
+    def _remember(self, key, png, product_id):
+        self._entries[key] = png
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            if not self.disk_dir:
+                self._forget(evicted)
+        if product_id is not None:
+            if self._key_products.get(key, product_id) != product_id:
+                self._forget(key)
+            self._product_keys.setdefault(product_id, set()).add(key)
+            self._key_products[key] = product_id
+
+    def _forget(self, key):
+        product_id = self._key_products.pop(key, None)
+        keys = self._product_keys.get(product_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._product_keys[product_id]
+
+    def get(self, key, product_id=None):
+        with self.lock:
+            png = self._entries.get(key)
+            if png is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return png
+        if self.disk_dir and os.path.exists(self._disk_path(key)):
+            with open(self._disk_path(key), 'rb') as f:
+                png = f.read()
+            with self.lock:
+                self.disk_hits += 1
+                self._remember(key, png, product_id)
+            return png
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, png, product_id=None):
+        with self.lock:
+            self._remember(key, png, product_id)
+        if self.disk_dir:
+            self._write_disk(key, png)
+
+    def get_or_render(self, key, render, product_id=None):
+        png = self.get(key, product_id)
+        if png is None:
+            png = render()
+            self.put(key, png, product_id)
+        return png
+
+    def _write_disk(self, key, png):
+        tmp = self._disk_path(key) + f'.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(png)
+        os.replace(tmp, self._disk_path(key))
+        self._disk_writes += 1
+        if self._disk_writes % 100 == 0:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        files = [os.path.join(self.disk_dir, n) for n in os.listdir(self.disk_dir) if n.endswith('.qr')]
+        if len(files) <= self.disk_max_entries:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - self.disk_max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            key = os.path.basename(path)[:-len('.qr')]
+            with self.lock:
+                if key not in self._entries:
+                    self._forget(key)
+
+    def invalidate_product(self, product_id):
+        with self.lock:
+            keys = self._product_keys.pop(product_id, set())
+            for key in keys:
+                self._entries.pop(key, None)
+                self._key_products.pop(key, None)
+            self.invalidations += 1
+        if self.disk_dir:
+            for key in keys:
+                try:
+                    os.remove(self._disk_path(key))
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'maxEntries': self.max_entries,
+                'diskTier': bool(self.disk_dir),
+                'hits': self.hits,
+                'diskHits': self.disk_hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hitRate': round((self.hits + self.disk_hits) / lookups, 4) if lookups else None
+            }
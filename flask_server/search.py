@@ -0,0 +1,147 @@
+import re
+from contextlib import contextmanager
+
+from sqlalchemy import text
+
+# Full-text product search. On SQLite an FTS5 table with the trigram tokenizer mirrors
+# products (kept in sync by triggers) so substring matches, including batch-number
+# fragments, come from an index and are ranked with bm25. On PostgreSQL pg_trgm GIN
+# indexes serve the same ILIKE-style matches, ranked by similarity.
+
+SQLITE_FTS_COLUMNS = 'product_id, name, batch_number, description, product_type, location'
+
+SQLITE_FTS_ROW = """new.rowid, new.id, new.name, new.batch_number, new.description, new.product_type,
+        (SELECT location FROM users WHERE id = new.origin_farm_id)"""
+
+SQLITE_BACKFILL = f"""INSERT INTO products_fts(rowid, {SQLITE_FTS_COLUMNS})
+    SELECT p.rowid, p.id, p.name, p.batch_number, p.description, p.product_type, u.location
+    FROM products p LEFT JOIN users u ON u.id = p.origin_farm_id"""
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+    "product_id UNINDEXED, name, batch_number, description, product_type, location, tokenize='trigram')",
+    f"""CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, {SQLITE_FTS_COLUMNS}) VALUES ({SQLITE_FTS_ROW});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE ON products BEGIN
+        DELETE FROM products_fts WHERE rowid = old.rowid;
+        INSERT INTO products_fts(rowid, {SQLITE_FTS_COLUMNS}) VALUES ({SQLITE_FTS_ROW});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+        DELETE FROM products_fts WHERE rowid = old.rowid;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF location ON users BEGIN
+        UPDATE products_fts SET location = new.location
+        WHERE rowid IN (SELECT rowid FROM products WHERE origin_farm_id = new.id);
+    END""",
+    "DELETE FROM products_fts",
+    SQLITE_BACKFILL,
+]
+
+# Per-row trigger inserts into FTS5 cost several times a set-based insert, so bulk writers
+# pause the insert trigger inside their transaction and index the new rows in one statement
+SQLITE_BULK_SYNC_DDL = [
+    "CREATE TABLE IF NOT EXISTS search_sync (id INTEGER PRIMARY KEY CHECK (id = 1), deferred INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO search_sync (id, deferred) VALUES (1, 0)",
+    "DROP TRIGGER IF EXISTS products_fts_ai",
+    f"""CREATE TRIGGER products_fts_ai AFTER INSERT ON products
+        WHEN (SELECT deferred FROM search_sync WHERE id = 1) = 0 BEGIN
+        INSERT INTO products_fts(rowid, {SQLITE_FTS_COLUMNS}) VALUES ({SQLITE_FTS_ROW});
+    END""",
+]
+
+POSTGRES_DDL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    """CREATE INDEX IF NOT EXISTS ix_products_search_trgm ON products USING gin (
+        (coalesce(name, '') || ' ' || coalesce(batch_number, '') || ' ' || coalesce(description, '')
+         || ' ' || coalesce(product_type, '')) gin_trgm_ops)""",
+    'CREATE INDEX IF NOT EXISTS ix_users_location_trgm ON users USING gin (location gin_trgm_ops)',
+]
+
+POSTGRES_DOCUMENT = ("coalesce(p.name, '') || ' ' || coalesce(p.batch_number, '') || ' ' || "
+                     "coalesce(p.description, '') || ' ' || coalesce(p.product_type, '')")
+
+# bm25 weights per FTS column: product_id (unindexed), name, batch_number, description, product_type, location
+SQLITE_WEIGHTS = '0.0, 10.0, 10.0, 2.0, 4.0, 1.0'
+
+
+def sqlite_fts_available(conn):
+    # trigram arrived in SQLite 3.34; older builds keep the plain LIKE search
+    version = tuple(int(part) for part in conn.execute(text('select sqlite_version()')).scalar().split('.'))
+    if version < (3, 34, 0):
+        return False
+    options = {row[0] for row in conn.execute(text('PRAGMA compile_options'))}
+    return 'ENABLE_FTS5' in options
+
+
+def install(conn):
+    """Migration step: create the search index for this dialect and backfill it."""
+    if conn.dialect.name == 'sqlite':
+        if not sqlite_fts_available(conn):
+            return
+        for statement in SQLITE_DDL:
+            conn.execute(text(statement))
+    elif conn.dialect.name == 'postgresql':
+        for statement in POSTGRES_DDL:
+            conn.execute(text(statement))
+
+
+def install_bulk_sync(conn):
+    """Migration step: let bulk inserts defer FTS indexing to one statement per transaction."""
+    if conn.dialect.name == 'sqlite' and has_fts_table(conn):
+        for statement in SQLITE_BULK_SYNC_DDL:
+            conn.execute(text(statement))
+
+
+@contextmanager
+def bulk_index(conn, enabled):
+    """Wrap a bulk product insert: the rows are added to the FTS index in one pass at the end.
+
+    Must run inside the inserting transaction; the pause is never visible to other writers
+    because SQLite serialises them and a rollback restores it.
+    """
+    if not enabled:
+        yield
+        return
+    start = conn.execute(text('SELECT coalesce(max(rowid), 0) FROM products')).scalar()
+    conn.execute(text('UPDATE search_sync SET deferred = 1 WHERE id = 1'))
+    yield
+    conn.execute(text(SQLITE_BACKFILL + ' WHERE p.rowid > :start'), {'start': start})
+    conn.execute(text('UPDATE search_sync SET deferred = 0 WHERE id = 1'))
+
+
+def has_fts_table(conn):
+    return conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+    )).first() is not None
+
+
+def fts_query(q):
+    # Each whitespace-separated term becomes a quoted trigram phrase; all must match
+    terms = [t for t in re.split(r'\s+', q) if t]
+    return ' '.join('"' + t.replace('"', '""') + '"' for t in terms)
+
+
+def search_product_ids(conn, q, limit, use_fts):
+    """Ranked product ids for `q`, best match first."""
+    terms = [t for t in re.split(r'\s+', q) if t]
+    if conn.dialect.name == 'sqlite' and use_fts and all(len(t) >= 3 for t in terms):
+        rows = conn.execute(text(
+            f"SELECT product_id FROM products_fts WHERE products_fts MATCH :q "
+            f"ORDER BY bm25(products_fts, {SQLITE_WEIGHTS}) LIMIT :limit"
+        ), {'q': fts_query(q), 'limit': limit})
+        return [row[0] for row in rows]
+    if conn.dialect.name == 'postgresql':
+        rows = conn.execute(text(
+            f"SELECT p.id FROM products p LEFT JOIN users u ON u.id = p.origin_farm_id "
+            f"WHERE ({POSTGRES_DOCUMENT}) ILIKE :pattern OR u.location ILIKE :pattern "
+            f"ORDER BY similarity({POSTGRES_DOCUMENT}, :q) DESC LIMIT :limit"
+        ), {'pattern': f'%{q}%', 'q': q, 'limit': limit})
+        return [row[0] for row in rows]
+    # Terms shorter than a trigram (or no FTS5): plain substring match over the same fields
+    rows = conn.execute(text(
+        "SELECT p.id FROM products p LEFT JOIN users u ON u.id = p.origin_farm_id "
+        "WHERE p.name LIKE :pattern OR p.batch_number LIKE :pattern OR p.description LIKE :pattern "
+        "OR p.product_type LIKE :pattern OR u.location LIKE :pattern LIMIT :limit"
+    ), {'pattern': f'%{q}%', 'limit': limit})
+    return [row[0] for row in rows]
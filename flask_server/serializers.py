@@ -0,0 +1,98 @@
+import os
+from datetime import datetime
+from functools import lru_cache
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib provider is used instead
+    orjson = None
+
+# Response serialisation. List endpoints turn selected columns straight into API dicts
+# (no ORM instances), dates are formatted once per distinct timestamp, and when orjson is
+# installed it encodes every jsonify() body. JSON_PROVIDER=stdlib keeps Flask's encoder.
+
+
+@lru_cache(maxsize=8192)
+def iso_date(ts):
+    # Harvest and expiry dates repeat across a farmer's lots, so most calls are cache hits
+    return datetime.fromtimestamp(ts).isoformat() if ts else None
+
+
+def row_serializer(fields, offset=0):
+    """Function turning a result row into an API dict.
+
+    `fields` is a sequence of (api name, formatter or None) in column order, starting at
+    row[offset]; leading columns (e.g. keyset cursor values) are skipped.
+    """
+    names = tuple(name for name, _ in fields)
+    formatted = tuple((name, fmt) for name, fmt in fields if fmt is not None)
+
+    def serialize(row):
+        item = dict(zip(names, row[offset:] if offset else row))
+        for name, fmt in formatted:
+            item[name] = fmt(item[name])
+        return item
+    return serialize
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson.
+
+    Output matches the default provider (sorted keys, datetimes as HTTP dates through
+    `default`, indented in debug mode) except that non-ASCII text is sent as UTF-8 rather
+    than escaped. Calls with stdlib-specific keyword arguments, and values orjson cannot
+    encode (e.g. integers beyond 64 bits), fall back to the stdlib encoder.
+    """
+
+    def _option(self, indent=False):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def _encode(self, obj, option):
+        try:
+            return orjson.dumps(obj, default=self.default, option=option)
+        except orjson.JSONEncodeError:
+            return None
+
+    def dumps(self, obj, **kwargs):
+        if not kwargs:
+            encoded = self._encode(obj, self._option())
+            if encoded is not None:
+                return encoded.decode()
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = self._encode(obj, self._option(indent) | orjson.OPT_APPEND_NEWLINE)
+        if body is None:
+            return super().response(obj)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+PROVIDERS = {'stdlib': DefaultJSONProvider, 'orjson': OrjsonProvider}
+
+
+def install(app):
+    """Select the app's JSON provider from JSON_PROVIDER (auto, orjson or stdlib)."""
+    app.config.setdefault('JSON_PROVIDER', os.environ.get('JSON_PROVIDER', 'auto'))
+    name = app.config['JSON_PROVIDER']
+    if name == 'auto':
+        name = 'orjson' if orjson is not None else 'stdlib'
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown JSON_PROVIDER {name!r}; expected auto, orjson or stdlib")
+    if name == 'orjson' and orjson is None:
+        raise RuntimeError('JSON_PROVIDER=orjson but orjson is not installed')
+    app.json = PROVIDERS[name](app)
+    return name
@@ -0,0 +1,40 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# app.py reads its configuration from the environment at import time, so point it at a
+# scratch database and chain store before any test imports it
+_scratch = tempfile.mkdtemp(prefix='agrotrace-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_scratch, 'test.db')}"
+os.environ['CHAIN_STORE_DIR'] = os.path.join(_scratch, 'chain')
+os.environ.pop('CHAIN_ROLE', None)
+
+# Modules import each other flat (import analytics), as when run from flask_server/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def agrotrace():
+    """The app module over a freshly created and seeded scratch database."""
+    import app as agrotrace
+    import migrations
+    with agrotrace.app.app_context():
+        agrotrace.db.create_all()
+        migrations.upgrade(agrotrace.db.engine)
+        agrotrace.seed_db()
+    yield agrotrace
+    agrotrace.blockchain.sync()
+
+
+@pytest.fixture
+def client(agrotrace):
+    return agrotrace.app.test_client()
+
+
+@pytest.fixture
+def farmer(client):
+    """A test client logged in as the seeded farmer."""
+    assert client.post('/api/auth/login', json={'email': 'farmer@example.com'}).status_code == 200
+    return client
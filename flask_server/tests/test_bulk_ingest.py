@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+import ingest
+
+
+def row(batch, **fields):
+    return dict({'name': 'Maize', 'productType': 'Grain', 'batchNumber': batch, 'quantity': 3, 'unit': 'kg'}, **fields)
+
+
+@pytest.mark.parametrize('fields, problem', [
+    ({'harvestDate': ['2024-01-01']}, 'harvestDate is not an ISO 8601 date'),
+    ({'expiryDate': 20240101}, 'expiryDate is not an ISO 8601 date'),
+    ({'harvestDate': 'yesterday'}, 'harvestDate is not an ISO 8601 date'),
+    ({'quantity': float('nan')}, 'quantity must be a finite number'),
+    ({'quantity': 'inf'}, 'quantity must be a finite number'),
+    ({'quantity': -1}, 'quantity must not be negative'),
+    ({'quantity': 'lots'}, 'quantity must be a number'),
+    ({'name': {'en': 'Maize'}}, 'name must be a string'),
+    ({'unit': ''}, 'unit is required'),
+])
+def test_invalid_rows_are_reported_individually(fields, problem):
+    valid, errors = ingest.validate_chunk([row('OK-1'), row('BAD-1', **fields), row('OK-2')])
+    assert [i for i, _ in valid] == [0, 2]
+    assert errors == [(1, [problem])]
+
+
+def test_dates_are_parsed_once_per_distinct_value():
+    valid, errors = ingest.validate_chunk([row(f'D-{i}', harvestDate='2024-03-15T00:00:00Z') for i in range(3)] +
+                                          [row('D-3', harvestDate='')])
+    assert not errors
+    dates = [fields['harvest_date'] for _, fields in valid]
+    assert dates[:3] == [dates[0]] * 3 and dates[0] > 0 and dates[3] is None
+
+
+def test_bulk_upload_keeps_valid_rows_and_publishes_stages(farmer, agrotrace):
+    sub = agrotrace.broker.subscribe(types=('stage',))
+    try:
+        response = farmer.post('/api/products/bulk', json=[row('BULK-1'), row('BULK-2', harvestDate=['x']), row('BULK-3')])
+        assert response.status_code == 201
+        body = response.get_json()
+        assert body['inserted'] == 2 and [e['row'] for e in body['errors']] == [1]
+        events = [json.loads(frame.split('data: ', 1)[1]) for frame in sub.wait(0)]
+        assert len(events) == 2 and {e['stageName'] for e in events} == {'Farm Production'}
+    finally:
+        agrotrace.broker.unsubscribe(sub)
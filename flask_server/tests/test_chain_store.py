@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from chain_store import INDEX_RECORD, BlockStore
+
+
+def block(index):
+    return {'index': index, 'transactions': [{'amount': index}], 'previous_hash': f'h{index - 1}'}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = BlockStore(str(tmp_path))
+    for i in range(1, 4):
+        store.append(block(i))
+    yield store
+    store.close()
+
+
+def test_blocks_survive_a_reopen(store, tmp_path):
+    hashes = [store.block_hash(i) for i in range(3)]
+    store.close()
+    reopened = BlockStore(str(tmp_path))
+    assert len(reopened) == 3 and list(reopened) == [block(i) for i in range(1, 4)]
+    assert reopened.find_by_hash(hashes[1]) == block(2)
+    assert reopened.find_by_hash('00' * 32) is None
+    reopened.close()
+
+
+@pytest.mark.parametrize('torn', ['log', 'idx'])
+def test_truncated_append_is_dropped_on_acquire(store, tmp_path, torn):
+    store.close()
+    log, idx = (os.path.join(tmp_path, name) for name in ('chain.log', 'chain.idx'))
+    log_size = os.path.getsize(log)
+    if torn == 'log':
+        # The index record made it to disk but only part of the block did
+        with open(log, 'ab') as f:
+            f.write(b'{"index": 4, "transac')
+        with open(idx, 'ab') as f:
+            f.write(INDEX_RECORD.pack(log_size, 40, b'\0' * 32))
+    else:
+        # The block line is complete but its index record was cut short
+        with open(log, 'ab') as f:
+            f.write(b'{"index": 4}\n')
+        with open(idx, 'ab') as f:
+            f.write(INDEX_RECORD.pack(log_size, 12, b'\0' * 32)[:10])
+    reopened = BlockStore(str(tmp_path))
+    # Opening alone must not touch the files: another process may be mid-append
+    assert len(reopened) == 3 and os.path.getsize(log) > log_size
+    reopened.append(block(4))
+    assert len(reopened) == 4 and reopened[3] == block(4)
+    assert os.path.getsize(idx) == 4 * INDEX_RECORD.size
+    reopened.close()
+    assert list(BlockStore(str(tmp_path), readonly=True)) == [block(i) for i in range(1, 5)]
+
+
+def test_reader_follows_the_writer(store, tmp_path):
+    reader = BlockStore(str(tmp_path), readonly=True)
+    assert len(reader) == 3
+    store.append(block(4))
+    store.sync()
+    assert len(reader) == 3 and reader.refresh() == 1 and reader[-1] == block(4)
+    store.append(block(5))
+    # A hash the reader has not seen yet triggers a refresh
+    assert reader.find_by_hash(store.block_hash(-1)) == block(5)
+    with pytest.raises(RuntimeError):
+        reader.append(block(6))
+    reader.close()
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='advisory locks are POSIX only')
+def test_second_writer_is_refused(store, tmp_path):
+    other = BlockStore(str(tmp_path))
+    with pytest.raises(RuntimeError, match='owned by another process'):
+        other.acquire()
+    other.close()
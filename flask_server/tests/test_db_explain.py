@@ -0,0 +1,24 @@
+import pytest
+
+import app as agrotrace
+import migrations
+
+
+@pytest.fixture(scope='module')
+def engine():
+    with agrotrace.app.app_context():
+        agrotrace.db.create_all()
+        migrations.upgrade(agrotrace.db.engine)
+        yield agrotrace.db.engine
+
+
+def test_hot_path_queries_use_an_index(engine):
+    # Same query list as `flask db-explain`
+    findings = migrations.full_scans(engine, agrotrace.hot_path_queries())
+    assert findings == {}, '\n'.join(f"{name}: {' | '.join(plan)}" for name, plan in findings.items())
+
+
+def test_full_scans_reports_unindexed_filters(engine):
+    # The check itself must notice a filter no index covers
+    query = agrotrace.select(agrotrace.Product).where(agrotrace.Product.unit == 'kg')
+    assert list(migrations.full_scans(engine, {'products_by_unit': query})) == ['products_by_unit']
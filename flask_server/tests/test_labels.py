@@ -0,0 +1,22 @@
+import pytest
+
+
+@pytest.mark.parametrize('body', [
+    [], 'abc', 5,
+    {'productIds': 'abc'}, {'productIds': [1, 2]}, {'productIds': {'a': 1}}, {'productIds': [['x']]},
+    {'batchPrefix': 5}, {'batchPrefix': ['W']},
+])
+def test_malformed_batch_requests_are_rejected(farmer, body):
+    assert farmer.post('/api/labels/batch', json=body).status_code == 400
+
+
+def test_too_many_product_ids(farmer, agrotrace):
+    ids = ['x'] * (agrotrace.app.config['LABEL_BATCH_MAX'] + 1)
+    assert farmer.post('/api/labels/batch', json={'productIds': ids}).status_code == 400
+
+
+def test_batch_by_prefix(farmer):
+    farmer.post('/api/products', json={'name': 'Oats', 'productType': 'Grain', 'batchNumber': 'LABEL-1',
+                                       'quantity': 1, 'unit': 'kg'})
+    response = farmer.post('/api/labels/batch', json={'batchPrefix': 'LABEL-'})
+    assert response.status_code == 200 and response.mimetype == 'application/zip'
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from blockchain import Blockchain, merkle_leaf, merkle_root, verify_merkle_proof
+from pow_engine import ProofOfWorkEngine
+
+
+def mined_block(transactions):
+    chain = Blockchain(engine=ProofOfWorkEngine(difficulty=4))
+    for i in range(transactions):
+        chain.add_transaction('a', 'b', i, f'p{i % 3}', 'transfer', transaction_id=f't{i}')
+    return chain, chain.mine_pending_block()
+
+
+@pytest.mark.parametrize('transactions', [1, 2, 5, 8])
+def test_every_transaction_proves_against_the_header(transactions):
+    chain, block = mined_block(transactions)
+    proofs = chain.transaction_proof(block)
+    assert [p['position'] for p in proofs] == list(range(transactions))
+    for proof in proofs:
+        header = json.loads(proof['headerData'])
+        assert merkle_leaf(json.loads(proof['leafData'])) == proof['leafHash']
+        assert verify_merkle_proof(proof['leafHash'], proof['path'], header['merkle_root'])
+
+
+def test_proofs_filter_by_transaction_and_product():
+    chain, block = mined_block(6)
+    assert [p['position'] for p in chain.transaction_proof(block, transaction_id='t4')] == [4]
+    assert [p['position'] for p in chain.transaction_proof(block, product_id='p1')] == [1, 4]
+
+
+def test_tampered_leaf_or_path_is_rejected():
+    chain, block = mined_block(5)
+    proof = chain.transaction_proof(block, transaction_id='t2')[0]
+    root = block['merkle_root']
+    tx = dict(block['transactions'][2], amount=1000)
+    assert not verify_merkle_proof(merkle_leaf(tx), proof['path'], root)
+    path = [dict(step) for step in proof['path']]
+    path[0]['hash'] = merkle_leaf(block['transactions'][0])
+    assert not verify_merkle_proof(proof['leafHash'], path, root)
+    flipped = [dict(step, position='left' if step['position'] == 'right' else 'right') for step in proof['path']]
+    assert not verify_merkle_proof(proof['leafHash'], flipped, root)
+
+
+def test_interior_node_does_not_pass_as_a_leaf():
+    chain, block = mined_block(4)
+    proof = chain.transaction_proof(block, transaction_id='t0')[0]
+    assert not verify_merkle_proof(proof['path'][0]['hash'], proof['path'][1:], block['merkle_root'])
+
+
+def test_block_hash_covers_the_header_only():
+    chain, block = mined_block(3)
+    block_hash = chain.block_hash(-1)
+    assert block_hash == Blockchain.hash(Blockchain.block_header(block))
+    # Transactions are committed through merkle_root, which does change the hash
+    assert Blockchain.hash(dict(block, transactions=[])) == block_hash
+    assert Blockchain.hash(dict(block, merkle_root=merkle_root(block['transactions'][:2]))) != block_hash
+    # Blocks without a merkle_root still hash their full transaction list
+    legacy = {k: v for k, v in block.items() if k != 'merkle_root'}
+    assert Blockchain.hash(legacy) != Blockchain.hash(dict(legacy, transactions=[]))
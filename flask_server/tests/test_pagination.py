@@ -0,0 +1,57 @@
+import base64
+import json
+
+import pytest
+
+
+def product(batch, **fields):
+    return dict({'name': 'Wheat', 'productType': 'Grain', 'batchNumber': batch, 'quantity': 10, 'unit': 'kg'}, **fields)
+
+
+@pytest.fixture(scope='module')
+def products(agrotrace):
+    client = agrotrace.app.test_client()
+    client.post('/api/auth/login', json={'email': 'farmer@example.com'})
+    ids = [client.post('/api/products', json=product(f'PAGE-{i}')).get_json()['id'] for i in range(5)]
+    return ids
+
+
+def raw_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+
+def test_cursor_walks_every_row_once(farmer, products):
+    seen, url = [], '/api/products?limit=2&fields=id'
+    while url:
+        response = farmer.get(url)
+        assert response.status_code == 200
+        seen += [row['id'] for row in response.get_json()]
+        link = response.headers.get('Link')
+        url = link[1:link.index('>')] if link else None
+    assert set(products) <= set(seen)
+    assert len(seen) == len(set(seen))
+
+
+@pytest.mark.parametrize('value', [[[1], 'x'], [1, 2], ['1', 'x'], [True, 'x'], [1, 'x', 3], {'a': 1}, 'x', None])
+def test_malformed_cursor_is_rejected(farmer, products, value):
+    assert farmer.get(f'/api/products?cursor={raw_cursor(value)}').status_code == 400
+
+
+def test_undecodable_cursor_is_rejected(farmer, products):
+    assert farmer.get('/api/products?cursor=not-base64!').status_code == 400
+
+
+@pytest.mark.parametrize('query', ['status=x', '_external=1', '_anchor=top', '_method=POST'])
+def test_next_link_with_clashing_query_args(farmer, products, query):
+    response = farmer.get(f'/api/products/by-status/created?{query}&limit=1')
+    assert response.status_code == 200
+    link = response.headers['Link']
+    assert link.startswith('<http://localhost/api/products/by-status/created?')
+    assert query in link and f"cursor={response.headers['X-Next-Cursor']}" in link
+
+
+def test_next_link_replaces_the_cursor(farmer, products):
+    first = farmer.get('/api/products?limit=1&fields=id')
+    second = farmer.get(f"/api/products?limit=1&fields=id&cursor={first.headers['X-Next-Cursor']}")
+    link = second.headers['Link']
+    assert link.count('cursor=') == 1 and f"cursor={second.headers['X-Next-Cursor']}" in link
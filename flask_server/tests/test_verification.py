@@ -0,0 +1,70 @@
+import pytest
+
+from blockchain import Blockchain
+from pow_engine import ProofOfWorkEngine
+
+
+def make_chain(blocks):
+    chain = Blockchain(engine=ProofOfWorkEngine(difficulty=4))
+    for i in range(blocks):
+        chain.add_transaction('a', 'b', i, f'p{i}', 'transfer')
+        chain.mine_pending_block()
+    return chain
+
+
+def test_incremental_checks_only_new_blocks():
+    chain = make_chain(3)
+    assert chain.verify()['blocksChecked'] == 4
+    chain.add_transaction('a', 'b', 9, 'p9', 'transfer')
+    chain.mine_pending_block()
+    report = chain.verify()
+    assert report['valid'] and report['blocksChecked'] == 1 and report['verifiedUpTo'] == 5
+
+
+def test_tampered_block_fails_full_audit_and_resets_checkpoint():
+    chain = make_chain(4)
+    assert chain.verify()['valid']
+    chain.chain[2]['transactions'][0]['amount'] = 1000
+    report = chain.verify(full=True)
+    assert not report['valid'] and report['invalidBlock'] == 3 and report['verifiedUpTo'] == 2
+    # The next incremental check starts at the failed block again
+    assert not chain.verify()['valid']
+
+
+def test_overlapping_success_does_not_skip_a_failed_block():
+    chain = make_chain(2)
+    chain.verify()
+    for i in range(3):
+        chain.add_transaction('a', 'b', i, 'q', 'transfer')
+        chain.mine_pending_block()
+    audit = chain._audit
+
+    def audit_with_concurrent_failure(start, stop, stored):
+        # While this incremental check runs, a full audit finds block 2 tampered with
+        chain._audit = audit
+        chain.chain[1]['proof'] += 1
+        assert not chain.verify(full=True)['valid']
+        return audit(start, stop, stored)
+
+    chain._audit = audit_with_concurrent_failure
+    report = chain.verify()
+    assert report['valid'] and report['verifiedUpTo'] == 1
+
+
+@pytest.mark.parametrize('email, status', [(None, 401), ('farmer@example.com', 403), ('admin@agrotrace.com', 200)])
+def test_full_audit_is_admin_only(client, email, status):
+    if email:
+        client.post('/api/auth/login', json={'email': email})
+    assert client.get('/api/blockchain/verify?mode=full').status_code == status
+    assert client.get('/api/blockchain/verify').status_code == 200
+
+
+def test_workers_are_validated_and_clamped(client, agrotrace, monkeypatch):
+    client.post('/api/auth/login', json={'email': 'admin@agrotrace.com'})
+    assert client.get('/api/blockchain/verify?mode=full&workers=abc').status_code == 400
+    requested = []
+    monkeypatch.setattr(agrotrace.blockchain, 'verify', lambda full, workers: requested.append(workers) or {})
+    monkeypatch.setitem(agrotrace.app.config, 'VERIFY_MAX_WORKERS', 2)
+    for workers in ('0', '64', '2'):
+        client.get(f'/api/blockchain/verify?mode=full&workers={workers}')
+    assert requested == [1, 2, 2]
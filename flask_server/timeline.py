@@ -0,0 +1,271 @@
+import itertools
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Per-product supply-chain timelines, cached as documents and extended in place when a stage
+# is appended instead of being re-queried. Long histories (e.g. hundreds of cold-chain sensor
+# readings) are compacted: all but the newest stages are folded into one summary entry per
+# run of same-named stages, so the consumer view stays small however long the product lives.
+#
+# Every product also has a generation number, bumped on every write. A document is only
+# served while its generation is current, so a reader that loaded the timeline just before
+# a concurrent append can never store (or serve) the stale copy. The backend is an
+# in-process LRU by default, or any Redis-compatible server shared between workers.
+
+
+class MemoryBackend:
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generations = OrderedDict()
+        # Generations come from one process-wide counter, so a dropped one is never reissued
+        self._counter = itertools.count(1)
+
+    def get(self, key):
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, doc, ttl):
+        with self.lock:
+            self._entries[key] = (doc, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self._entries.pop(key, None)
+
+    def generation(self, key):
+        with self.lock:
+            return self._generations.get(key, 0)
+
+    def bump(self, key):
+        """Advance the generation; returns (old, new)."""
+        with self.lock:
+            old = self._generations.pop(key, 0)
+            new = self._generations[key] = next(self._counter)
+            while len(self._generations) > self.max_entries * 4:
+                self._generations.popitem(last=False)
+            return old, new
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class NullBackend:
+    """Caches nothing: every read loads from the database. For workers without a shared backend."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, doc, ttl):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def generation(self, key):
+        return 0
+
+    def bump(self, key):
+        return 0, 0
+
+    def __len__(self):
+        return 0
+
+
+class RedisBackend:
+    """Documents as JSON strings in any Redis-protocol server (redis, valkey, a local stand-in).
+
+    `client` needs get/set(ex=)/delete/incr/expire, as provided by redis-py.
+    """
+
+    def __init__(self, client, prefix='agrotrace:timeline:', generation_ttl=86400):
+        self.client = client
+        self.prefix = prefix
+        self.generation_ttl = generation_ttl
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError(f'TIMELINE_CACHE_URL={url} needs the redis package (pip install redis)')
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, doc, ttl):
+        self.client.set(self.prefix + key, json.dumps(doc), ex=int(ttl))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def generation(self, key):
+        return int(self.client.get(self.prefix + 'gen:' + key) or 0)
+
+    def bump(self, key):
+        # INCR is atomic on the server, so concurrent writers in any process get distinct values
+        new = self.client.incr(self.prefix + 'gen:' + key)
+        self.client.expire(self.prefix + 'gen:' + key, self.generation_ttl)
+        return new - 1, new
+
+    def __len__(self):
+        return 0
+
+
+def run_key(stage):
+    return (stage['stageName'], stage['stageType'])
+
+
+def summarise(stage):
+    """A single stage as the start of a compacted run; shaped like a stage for the UI."""
+    return dict(stage, id=None, handlerId=None, verificationData=None, summary={
+        'count': 1,
+        'firstTimestamp': stage['timestamp'],
+        'lastTimestamp': stage['timestamp'],
+        'locations': [stage['location']] if stage.get('location') else [],
+        'statuses': {stage['status']: 1},
+    })
+
+
+def fold(summary, stage, max_locations=10):
+    info = dict(summary['summary'])
+    info['count'] += 1
+    info['lastTimestamp'] = stage['timestamp']
+    if stage.get('location') and stage['location'] not in info['locations'] and len(info['locations']) < max_locations:
+        info['locations'] = info['locations'] + [stage['location']]
+    info['statuses'] = dict(info['statuses'])
+    info['statuses'][stage['status']] = info['statuses'].get(stage['status'], 0) + 1
+    return dict(summary, timestamp=stage['timestamp'], location=stage.get('location') or summary['location'],
+                status=stage['status'], notes=f"{info['count']} {stage['stageName']} events", summary=info)
+
+
+class TimelineCache:
+    """Supply-chain timelines per product, loaded once and then appended to.
+
+    `loader(product_id)` returns the product's stages as API dicts in timestamp order.
+    Once a timeline holds more than `compact_after` stages, everything but the newest
+    `keep_recent` is compacted into the head: consecutive stages with the same name and
+    type become one summary entry; one-off stages stay as they are.
+    """
+
+    def __init__(self, loader, backend=None, ttl=300, compact_after=100, keep_recent=20):
+        self.loader = loader
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.compact_after = compact_after
+        self.keep_recent = keep_recent
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.appends = 0
+        self.invalidations = 0
+        self.compactions = 0
+
+    # Documents
+
+    def _empty(self, generation):
+        return {'gen': generation, 'head': [], 'tail': [], 'count': 0, 'compacted': False}
+
+    def _extend(self, doc, stages):
+        """A new document with `stages` appended (the input document is never mutated)."""
+        head, tail = doc['head'], doc['tail'] + list(stages)
+        compacted = doc['compacted']
+        if len(tail) > self.compact_after:
+            head = list(head)
+            for stage in tail[:-self.keep_recent]:
+                last = head[-1] if head else None
+                if last is not None and run_key(last) == run_key(stage):
+                    head[-1] = fold(last if 'summary' in last else summarise(last), stage)
+                    compacted = True
+                else:
+                    head.append(stage)
+            tail = tail[-self.keep_recent:]
+            self.compactions += 1
+        return {'gen': doc['gen'], 'head': head, 'tail': tail, 'count': doc['count'] + len(stages),
+                'compacted': compacted}
+
+    def _doc(self, product_id):
+        generation = self.backend.generation(product_id)
+        doc = self.backend.get(product_id)
+        if doc is not None and doc['gen'] == generation:
+            self.hits += 1
+            return doc
+        self.misses += 1
+        doc = self._extend(self._empty(generation), self.loader(product_id))
+        self.backend.set(product_id, doc, self.ttl)
+        return doc
+
+    # Reads
+
+    def view(self, product_id):
+        """The consumer timeline: compacted summaries followed by the recent stages."""
+        doc = self._doc(product_id)
+        return doc['head'] + doc['tail']
+
+    def full(self, product_id):
+        """Every stage; compacted timelines are read from the database instead."""
+        doc = self._doc(product_id)
+        if doc['compacted']:
+            return self.loader(product_id)
+        return doc['head'] + doc['tail']
+
+    def count(self, product_id):
+        return self._doc(product_id)['count']
+
+    # Writes (call after the rows are committed)
+
+    def append(self, product_id, stages):
+        with self.lock:
+            old, new = self.backend.bump(product_id)
+            doc = self.backend.get(product_id)
+            if doc is None:
+                return
+            recent = {s['id'] for s in doc['tail']}
+            stages = [s for s in stages if s['id'] not in recent]
+            timestamps = [s['timestamp'] for s in (doc['head'] + doc['tail'])[-1:] + stages]
+            in_order = all(a <= b for a, b in zip(timestamps, timestamps[1:]))
+            if doc['gen'] != old or not in_order:
+                # Someone else wrote since this copy was made, or the stage is backdated
+                self.backend.delete(product_id)
+                self.invalidations += 1
+                return
+            self.backend.set(product_id, self._extend(dict(doc, gen=new), stages), self.ttl)
+            self.appends += 1
+
+    def invalidate(self, *product_ids):
+        with self.lock:
+            for product_id in product_ids:
+                self.backend.bump(product_id)
+                self.backend.delete(product_id)
+                self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': len(self.backend),
+            'ttl': self.ttl,
+            'compactAfter': self.compact_after,
+            'keepRecent': self.keep_recent,
+            'hits': self.hits,
+            'misses': self.misses,
+            'appends': self.appends,
+            'invalidations': self.invalidations,
+            'compactions': self.compactions,
+            'hitRate': round(self.hits / lookups, 4) if lookups else None
+        }
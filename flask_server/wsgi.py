@@ -0,0 +1,7 @@
+# Production entry point: gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Run `flask --app app db-init` once and a single `flask --app app chain-owner` next to the
+# workers; gunicorn.conf.py starts every worker with CHAIN_ROLE=reader.
+from app import app
+
+__all__ = ['app']